@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки MCP сервера
+Запуск: python benchmark.py {startup,snapshot,writes,projection,rows,shards} [параметры]
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import gc
+import tempfile
+import threading
+import time
+import tracemalloc
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def bench_startup(runs: int):
+    """Время от запуска процесса server.py до ответа на initialize"""
+    request = json.dumps({
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "initialize",
+        "params": {}
+    }) + "\n"
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "server.py"],
+            cwd=SERVER_DIR,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8"
+        )
+        proc.stdin.write(request)
+        proc.stdin.flush()
+        response = json.loads(proc.stdout.readline())
+        timings.append((time.perf_counter() - start) * 1000)
+        proc.stdin.close()
+        proc.wait()
+
+        if "result" not in response and "protocolVersion" not in response:
+            raise RuntimeError(f"Неожиданный ответ: {response}")
+
+    print(f"startup: {runs} запусков")
+    print(f"  медиана: {statistics.median(timings):.1f} мс")
+    print(f"  минимум: {min(timings):.1f} мс")
+    print(f"  максимум: {max(timings):.1f} мс")
+
+
+def make_catalog(rows: int, shard_count: int = 1) -> str:
+    """
+    Создает временную БД с заданным числом товаров и возвращает путь к ней.
+    При shard_count > 1 товары по очереди распределяются по шардам (как PRODUCTS_SHARD_BY=id)
+    """
+    import db
+    import shards
+
+    if shard_count > 1:
+        # При шардировании файла DB_PATH быть не должно - только шарды рядом с ним
+        path = os.path.join(tempfile.mkdtemp(), "products.db")
+    else:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+    db.DB_PATH = path
+    db.SHARDS = shard_count
+    db.SHARD_BY = "id"
+    db._initialized = False
+    db._snapshot = None
+    db._writers = {}
+    db._router = None
+    db._shard_pool = None
+    db.init_db()
+
+    # Одинаковые данные при одинаковом rows: результаты с шардами и без можно сравнить
+    rng = random.Random(rows)
+    categories = sorted({category for _, category, _ in db.TEST_PRODUCTS})
+    products = [
+        (f"Товар {i}", rng.choice(categories), round(rng.uniform(10, 1000), 2))
+        for i in range(rows)
+    ]
+    seeded = len(db.TEST_PRODUCTS)
+    for shard in range(shard_count):
+        conn = db.get_connection(shard)
+        if shard_count == 1:
+            conn.executemany("INSERT INTO products (name, category, price) VALUES (?, ?, ?)", products)
+        else:
+            prefix = shards.insert_prefix(shard, shard_count)
+            # Продолжаем очередь после тестовых товаров: ID совпадают с ID без шардирования
+            conn.executemany(shards.INSERT_PRODUCT, (
+                prefix + product for i, product in enumerate(products)
+                if (seeded + i) % shard_count == shard
+            ))
+        # Начальное заполнение не нужно в ленте изменений
+        conn.execute("DELETE FROM changes")
+        conn.commit()
+        conn.close()
+    return path
+
+
+def remove_catalog(path: str, shard_count: int = 1):
+    """Удаляет временную БД и ее шарды"""
+    import shards
+
+    if shard_count == 1:
+        os.remove(path)
+        return
+    for shard in range(shard_count):
+        os.remove(shards.shard_path(path, shard))
+    os.rmdir(os.path.dirname(path))
+
+
+def measure(func, repeat: int):
+    """Медианное время вызова в миллисекундах"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def bench_snapshot(rows: int, repeat: int):
+    """Чтение из SQLite против колоночного снимка"""
+    import db
+
+    path = make_catalog(rows)
+    try:
+        cases = [
+            ("list_products", db.get_all_products),
+            ("category", lambda: db.find_products_by_category("Молочные")),
+        ]
+        print(f"snapshot: {rows} товаров, медиана из {repeat}")
+        for name, func in cases:
+            db.USE_SNAPSHOT = False
+            sqlite_ms = measure(func, repeat)
+            db.USE_SNAPSHOT = True
+            db.get_snapshot()
+            snapshot_ms = measure(func, repeat)
+            print(f"  {name}: sqlite {sqlite_ms:.1f} мс, snapshot {snapshot_ms:.1f} мс")
+
+        db.USE_SNAPSHOT = False
+        tracemalloc.start()
+        products = db.get_all_products()
+        dicts_size = tracemalloc.get_traced_memory()[0]
+        del products
+        tracemalloc.stop()
+
+        db._snapshot = None
+        db.USE_SNAPSHOT = True
+        tracemalloc.start()
+        db.get_snapshot()
+        snapshot_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"  память: список товаров {dicts_size / 2**20:.1f} МБ, снимок {snapshot_size / 2**20:.1f} МБ")
+    finally:
+        os.remove(path)
+
+
+def bench_writes(writers: int, rows: int):
+    """Одновременные add_product: транзакция на строку против групповой фиксации"""
+    import db
+
+    def insert_each(index: int):
+        # Прежняя схема: свое соединение и своя фиксация на каждую строку
+        conn = db._connect()
+        conn.execute("PRAGMA busy_timeout = 30000")
+        conn.execute(
+            "INSERT INTO products (name, category, price) VALUES (?, ?, ?)",
+            (f"Новый товар {index}", "Овощи", 10.0)
+        )
+        conn.commit()
+        conn.close()
+
+    def insert_grouped(index: int):
+        db.add_product(f"Новый товар {index}", "Овощи", 10.0)
+
+    path = make_catalog(0)
+    try:
+        print(f"writes: {writers} потоков, {rows} вставок")
+        for name, insert in (("по одной", insert_each), ("группами", insert_grouped)):
+            counter = iter(range(rows))
+            lock = threading.Lock()
+
+            def worker():
+                while True:
+                    with lock:
+                        index = next(counter, None)
+                    if index is None:
+                        return
+                    insert(index)
+
+            threads = [threading.Thread(target=worker) for _ in range(writers)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            print(f"  {name}: {elapsed:.2f} с ({rows / elapsed:.0f} вставок в секунду)")
+
+        metrics = db.write_metrics()
+        print(f"  групп: {metrics['commits']}, средний размер {metrics['avg_batch_size']}, "
+              f"фиксация: средняя {metrics['commit_ms_avg']:.2f} мс, максимум {metrics['commit_ms_max']:.2f} мс")
+    finally:
+        os.remove(path)
+
+
+def bench_projection(rows: int, repeat: int):
+    """list_products: полные объекты против проекции полей и компактного формата"""
+    import db
+    import product
+    import tools
+
+    path = make_catalog(rows)
+    try:
+        cases = [
+            ("все поля, объекты", {}),
+            ("id+price, объекты", {"fields": ["id", "price"]}),
+            ("все поля, compact", {"format": "compact"}),
+            ("id+price, compact", {"fields": ["id", "price"], "format": "compact"}),
+        ]
+        print(f"projection: {rows} товаров, медиана из {repeat}")
+        for snapshot in (False, True):
+            db.USE_SNAPSHOT = snapshot
+            print("  снимок в памяти" if snapshot else "  SQLite")
+            for name, arguments in cases:
+                encode = lambda: product.dumps(tools.execute_tool("list_products", arguments))
+                elapsed = measure(encode, repeat)
+                size = len(encode().encode("utf-8"))
+
+                tracemalloc.start()
+                result = tools.execute_tool("list_products", arguments)
+                allocated = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                del result
+                print(f"    {name}: {elapsed:.1f} мс, ответ {size / 2**20:.2f} МБ, "
+                      f"пик памяти {allocated / 2**20:.1f} МБ")
+    finally:
+        os.remove(path)
+
+
+def bench_rows(rows: int):
+    """Память и время get_all_products: словарь на строку против Product"""
+    import db
+    import product
+
+    def fetch_dicts():
+        # Прежнее представление: sqlite3.Row -> dict на каждую строку
+        conn = db.get_connection()
+        products = [dict(row) for row in conn.execute("SELECT * FROM products ORDER BY id")]
+        conn.close()
+        return products
+
+    path = make_catalog(rows)
+    try:
+        db.USE_SNAPSHOT = False
+        print(f"rows: {rows} товаров")
+        for name, fetch in (("словари", fetch_dicts), ("Product", db.get_all_products)):
+            gc.collect()
+            tracemalloc.start()
+            start = time.perf_counter()
+            products = fetch()
+            elapsed = (time.perf_counter() - start) * 1000
+            retained = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            gc.collect()
+            gc_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            product.dumps(products)
+            encode_ms = (time.perf_counter() - start) * 1000
+            del products
+            print(f"  {name}: {retained / 2**20:.0f} МБ ({retained / rows:.0f} байт на товар), "
+                  f"выборка {elapsed:.0f} мс, полная сборка мусора {gc_ms:.0f} мс, JSON {encode_ms:.0f} мс")
+    finally:
+        os.remove(path)
+
+
+def bench_shards(rows: int, shard_count: int, repeat: int):
+    """Запросы к одному файлу против параллельных запросов в шарды"""
+    import db
+
+    cases = [
+        ("страница по цене", lambda: db.get_all_products(order_by="price", limit=50, offset=1000)),
+        ("поиск по названию", lambda: db.find_product_by_name("77", limit=50)),
+        ("диапазон цен", lambda: db.find_products_by_price_range(
+            100, 200, order_by="price_desc", limit=50, offset=100)),
+        ("поиск по ID", lambda: db.find_product_by_id(rows // 2)),
+    ]
+    print(f"shards: {rows} товаров, медиана из {repeat}")
+    results = {}
+    for count in (1, shard_count):
+        path = make_catalog(rows, count)
+        try:
+            db.USE_SNAPSHOT = False
+            print(f"  шардов: {count}")
+            for name, func in cases:
+                elapsed = measure(func, repeat)
+                results.setdefault(name, []).append(func())
+                print(f"    {name}: {elapsed:.1f} мс")
+        finally:
+            remove_catalog(path, count)
+    mismatched = [name for name, (single, sharded) in results.items() if single != sharded]
+    print("  результаты совпадают" if not mismatched else f"  результаты различаются: {', '.join(mismatched)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки MCP сервера")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    startup = subparsers.add_parser("startup", help="Время до первого ответа на initialize")
+    startup.add_argument("--runs", type=int, default=20)
+
+    snapshot = subparsers.add_parser("snapshot", help="Чтение из SQLite и из колоночного снимка")
+    snapshot.add_argument("--rows", type=int, default=100_000)
+    snapshot.add_argument("--repeat", type=int, default=5)
+
+    writes = subparsers.add_parser("writes", help="Одновременные add_product с групповой фиксацией и без")
+    writes.add_argument("--writers", type=int, default=16)
+    writes.add_argument("--rows", type=int, default=2000)
+
+    projection = subparsers.add_parser("projection", help="Проекция полей и компактный формат ответа")
+    projection.add_argument("--rows", type=int, default=100_000)
+    projection.add_argument("--repeat", type=int, default=5)
+
+    rows_parser = subparsers.add_parser("rows", help="Память на строку: словари против Product")
+    rows_parser.add_argument("--rows", type=int, default=1_000_000)
+
+    shards_parser = subparsers.add_parser("shards", help="Один файл БД против нескольких шардов")
+    shards_parser.add_argument("--rows", type=int, default=1_000_000)
+    shards_parser.add_argument("--shards", type=int, default=4)
+    shards_parser.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "startup":
+        bench_startup(args.runs)
+    elif args.command == "snapshot":
+        bench_snapshot(args.rows, args.repeat)
+    elif args.command == "writes":
+        bench_writes(args.writers, args.rows)
+    elif args.command == "projection":
+        bench_projection(args.rows, args.repeat)
+    elif args.command == "rows":
+        bench_rows(args.rows)
+    elif args.command == "shards":
+        bench_shards(args.rows, args.shards, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,51 @@
 import sqlite3
+import logging
 import random
 import os
+import threading
+import time
+
+import shards
+from group_commit import GroupCommitWriter
+from product import product_row
+
+logger = logging.getLogger("db")
 
 DB_PATH = "products.db"
 
+# Колоночный снимок каталога в памяти для чтения без обращения к SQLite
+USE_SNAPSHOT = os.getenv("PRODUCTS_SNAPSHOT", "0") == "1"
+
+# Как часто чтение сверяет снимок с лентой изменений (секунды): записи этого процесса
+# попадают в снимок сразу после фиксации, записи других процессов - с этой задержкой
+SNAPSHOT_SYNC_INTERVAL = float(os.getenv("PRODUCTS_SNAPSHOT_SYNC_INTERVAL", "1"))
+
+# Групповая фиксация add_product: максимум строк в группе и сколько писатель
+# добирает вставки после первой (миллисекунды)
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "100"))
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "2"))
+
+# Сколько последних изменений хранится в таблице changes для возобновления ленты
+CHANGES_RETENTION = int(os.getenv("CHANGES_RETENTION", "100000"))
+
+# Старые изменения удаляются раз в столько групповых фиксаций
+CHANGES_PRUNE_EVERY = 100
+
+# Сколько писатель ждет блокировку записи, занятую другим процессом (миллисекунды)
+WRITE_BUSY_TIMEOUT_MS = int(os.getenv("WRITE_BUSY_TIMEOUT_MS", "30000"))
+
+# Число файлов-шардов каталога (1 - один файл DB_PATH без шардирования).
+# Шарды: products.0.db, products.1.db, ... рядом с DB_PATH
+SHARDS = int(os.getenv("PRODUCTS_SHARDS", "1"))
+
+# Распределение новых товаров по шардам: id (по очереди) или category (по хешу категории)
+SHARD_BY = os.getenv("PRODUCTS_SHARD_BY", "id")
+
+# Потоков для параллельных запросов в шарды (0 - по умолчанию): пул общий для всех
+# запросов, поэтому по потоку на шард для каждого из 40 одновременных запросов
+# (размер пула потоков FastAPI). Потоки создаются по мере надобности
+SHARD_WORKERS = int(os.getenv("PRODUCTS_SHARD_WORKERS", "0"))
+
 # Тестовые данные для заполнения БД
 TEST_PRODUCTS = [
     # Овощи
@@ -128,100 +170,720 @@ TEST_PRODUCTS = [
 ]
 
 
-def get_connection():
-    """Создает и возвращает соединение с БД"""
-    conn = sqlite3.connect(DB_PATH)
+# Версия схемы БД (хранится в PRAGMA user_version)
+SCHEMA_VERSION = 4
+
+# Допустимые сортировки для списков товаров
+# (id в конце делает порядок однозначным - это нужно для постраничного вывода)
+ORDER_BY = {
+    "id": "id",
+    "name": "name, id",
+    "price": "price, id",
+    "price_desc": "price DESC, id DESC",
+}
+
+# Флаг ленивой инициализации: схема проверяется один раз на процесс
+_initialized = False
+
+# Блокировка для ленивой инициализации схемы и индексов в памяти
+# (HTTP сервер выполняет инструменты в пуле потоков)
+_init_lock = threading.RLock()
+
+# Снимок каталога (создается при первом чтении, если USE_SNAPSHOT)
+_snapshot = None
+
+# Время последней сверки снимка с лентой изменений (time.monotonic)
+_snapshot_synced = 0.0
+
+# Индекс нечеткого поиска по названиям (создается при первом поиске)
+_fuzzy_index = None
+
+# Индекс префиксов для автодополнения (создается при первом запросе)
+_prefix_index = None
+
+# Потоки-писатели для add_product по шардам (создаются при первой записи в шард)
+_writers = {}
+
+# Выбор шарда для новых товаров и пул потоков для запросов во все шарды
+_router = None
+_shard_pool = None
+
+# Подписчики на изменения каталога (вызываются из потока-писателя после фиксации)
+_change_listeners = []
+
+# Групповых фиксаций с последней очистки таблицы changes (по шардам)
+_commits_since_prune = {}
+
+
+def _connect(shard=0):
+    """Открывает соединение с БД (шардом) без проверки схемы"""
+    path = DB_PATH if SHARDS == 1 else shards.shard_path(DB_PATH, shard)
+    conn = sqlite3.connect(path)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+def get_connection(shard=0):
+    """Создает и возвращает соединение с БД (с шардом shard при шардировании)"""
+    if not _initialized:
+        init_db()
+    return _connect(shard)
+
+
+def get_router():
+    """Возвращает выбор шарда для новых товаров"""
+    global _router
+    if _router is None:
+        with _init_lock:
+            if _router is None:
+                _router = shards.ShardRouter(SHARDS, SHARD_BY)
+    return _router
+
+
+def get_shard_pool():
+    """Возвращает пул потоков для параллельных запросов в шарды"""
+    global _shard_pool
+    if _shard_pool is None:
+        with _init_lock:
+            if _shard_pool is None:
+                _shard_pool = shards.ShardPool(SHARD_WORKERS or SHARDS * 40)
+    return _shard_pool
+
+
 def init_db():
-    """Инициализирует БД и создает таблицу products"""
-    conn = get_connection()
+    """
+    Инициализирует БД и создает таблицу products.
+    Выполняется один раз на процесс: версия схемы читается из PRAGMA user_version,
+    поэтому на уже созданной БД это одно чтение заголовка без сканирования таблицы.
+    """
+    global _initialized
+    with _init_lock:
+        if not _initialized:
+            _check_shard_files()
+            for shard in range(SHARDS):
+                _migrate(shard)
+            if USE_SNAPSHOT and SHARDS > 1:
+                logger.warning("Снимок каталога не используется при PRODUCTS_SHARDS > 1: чтение идет из шардов")
+            _initialized = True
+
+
+def _check_shard_files():
+    """
+    Отказывается работать с каталогом, созданным с другим числом шардов: иначе он был бы
+    молча проигнорирован или заполнен заново, а ID новых товаров пересеклись бы со старыми
+    """
+    if SHARDS == 1:
+        stray = [shards.shard_path(DB_PATH, 0)]
+    else:
+        stray = [DB_PATH, shards.shard_path(DB_PATH, SHARDS)]
+    for path in stray:
+        if os.path.exists(path):
+            raise ValueError(
+                f"Найден {path}: каталог создан с другим числом шардов, а PRODUCTS_SHARDS={SHARDS}"
+            )
+
+
+def _check_catalog_meta(cursor, shard):
+    """Сверяет параметры шардирования, записанные в БД при создании, с текущими"""
+    meta = dict(cursor.execute("SELECT key, value FROM catalog_meta").fetchall())
+    expected = {"shards": str(SHARDS), "shard": str(shard)}
+    if SHARDS > 1:
+        expected["shard_by"] = SHARD_BY
+    mismatched = [key for key, value in expected.items() if meta.get(key) != value]
+    if mismatched:
+        found = ", ".join(f"{key}={meta.get(key)}" for key in mismatched)
+        raise ValueError(
+            f"Каталог создан с другими параметрами шардирования ({found}), "
+            f"а PRODUCTS_SHARDS={SHARDS}, PRODUCTS_SHARD_BY={SHARD_BY}"
+        )
+
+
+def _seed_products(shard):
+    """Тестовые товары, которые попадают в шард (все товары без шардирования)"""
+    if SHARDS == 1:
+        return TEST_PRODUCTS
+    # Новый выбор шарда, чтобы по очереди распределялись именно тестовые товары:
+    # при SHARD_BY=id их ID совпадают с ID в нешардированной БД
+    router = shards.ShardRouter(SHARDS, SHARD_BY)
+    return [product for product in TEST_PRODUCTS if router.for_insert(product[1]) == shard]
+
+
+def _migrate(shard=0):
+    """Доводит схему БД (шарда) до SCHEMA_VERSION"""
+    conn = _connect(shard)
     cursor = conn.cursor()
     
-    # Создаем таблицу
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            category TEXT NOT NULL,
-            price REAL NOT NULL
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    seeded = 0
+    
+    if version < 1:
+        # Создаем таблицу
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                category TEXT NOT NULL,
+                price REAL NOT NULL
+            )
+        """)
+        
+        # Проверяем, есть ли уже данные (БД, созданные до версионирования схемы)
+        cursor.execute("SELECT 1 FROM products LIMIT 1")
+        
+        # Если таблица пустая, заполняем тестовыми данными
+        if cursor.fetchone() is None:
+            products = _seed_products(shard)
+            if SHARDS == 1:
+                cursor.executemany(
+                    "INSERT INTO products (name, category, price) VALUES (?, ?, ?)",
+                    products
+                )
+            else:
+                prefix = shards.insert_prefix(shard, SHARDS)
+                cursor.executemany(shards.INSERT_PRODUCT, [prefix + product for product in products])
+            seeded = len(products)
+    
+    if version < 2:
+        # Индексы для диапазонов цен и top-N по цене внутри категории
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_products_price ON products (price)")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_products_category_price ON products (category, price)"
         )
-    """)
     
-    # Проверяем, есть ли уже данные
-    cursor.execute("SELECT COUNT(*) FROM products")
-    count = cursor.fetchone()[0]
+    if version < 3:
+        # Лента изменений: каждая запись в products получает возрастающий номер seq.
+        # Триггеры видят и записи других процессов и утилит, не только add_product
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                op TEXT NOT NULL,
+                product_id INTEGER NOT NULL
+            )
+        """)
+        for op, event, row in (("insert", "INSERT", "NEW"), ("update", "UPDATE", "NEW"),
+                               ("delete", "DELETE", "OLD")):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS products_{op}_change AFTER {event} ON products
+                BEGIN
+                    INSERT INTO changes (op, product_id) VALUES ('{op}', {row}.id);
+                END
+            """)
     
-    # Если таблица пустая, заполняем тестовыми данными
-    if count == 0:
+    if version < 4:
+        # Параметры шардирования, с которыми создан каталог (проверяются при каждом запуске)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS catalog_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        """)
+        # В БД, созданной до версии 4, ID всех товаров должны принадлежать этому шарду
+        foreign = cursor.execute(
+            "SELECT id FROM products WHERE (id - 1) % ? != ? LIMIT 1", (SHARDS, shard)
+        ).fetchone()
+        if foreign is not None:
+            conn.close()
+            raise ValueError(
+                f"Товар с ID {foreign[0]} не принадлежит шарду {shard}: "
+                f"каталог создан с другим числом шардов, а PRODUCTS_SHARDS={SHARDS}"
+            )
         cursor.executemany(
-            "INSERT INTO products (name, category, price) VALUES (?, ?, ?)",
-            TEST_PRODUCTS
+            "INSERT OR IGNORE INTO catalog_meta (key, value) VALUES (?, ?)",
+            [("shards", str(SHARDS)), ("shard", str(shard)), ("shard_by", SHARD_BY)]
         )
+    
+    if version < SCHEMA_VERSION:
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         conn.commit()
-        print(f"База данных инициализирована. Добавлено {len(TEST_PRODUCTS)} товаров.")
+        if seeded:
+            logger.info("База данных инициализирована. Добавлено %s товаров.", seeded)
     
-    conn.close()
+    try:
+        _check_catalog_meta(cursor, shard)
+    finally:
+        conn.close()
 
 
-def get_all_products():
-    """Возвращает все товары из БД"""
+def get_snapshot():
+    """
+    Возвращает колоночный снимок каталога или None, если он выключен.
+    Не чаще раза в SNAPSHOT_SYNC_INTERVAL секунд чтение сверяет снимок с лентой
+    изменений, поэтому он видит и записи других процессов; остальные чтения
+    не обращаются к SQLite
+    """
+    global _snapshot
+    if not USE_SNAPSHOT or SHARDS > 1:
+        return None
+    if _snapshot is None:
+        with _init_lock:
+            if _snapshot is None:
+                from snapshot import CatalogSnapshot
+                _snapshot = CatalogSnapshot()
+    if time.monotonic() - _snapshot_synced >= SNAPSHOT_SYNC_INTERVAL:
+        refresh_snapshot()
+    return _snapshot
+
+
+def refresh_snapshot():
+    """
+    Дозагружает в снимок новые товары или строит его заново после изменений и удалений.
+    Вызывается при чтении (см. get_snapshot) и потоком-писателем после каждой фиксации
+    """
+    global _snapshot_synced
+    if _snapshot is None:
+        return
+    synced = time.monotonic()
     conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM products ORDER BY id")
-    products = [dict(row) for row in cursor.fetchall()]
+    try:
+        _snapshot.sync(conn)
+    finally:
+        conn.close()
+    _snapshot_synced = synced
+
+
+def add_change_listener(callback):
+    """Регистрирует функцию, вызываемую после каждой записи в каталог"""
+    _change_listeners.append(callback)
+
+
+def _after_write(shard=0):
+    """
+    Вызывается потоком-писателем шарда после групповой фиксации.
+    Ошибка обновления снимка или очистки ленты не мешает уведомить подписчиков
+    """
+    try:
+        refresh_snapshot()
+    except Exception:
+        logger.exception("Ошибка обновления снимка каталога")
+    
+    _commits_since_prune[shard] = _commits_since_prune.get(shard, 0) + 1
+    if _commits_since_prune[shard] >= CHANGES_PRUNE_EVERY:
+        _commits_since_prune[shard] = 0
+        try:
+            prune_changes(shard=shard)
+        except Exception:
+            logger.exception("Ошибка очистки ленты изменений шарда %s", shard)
+    
+    for callback in _change_listeners:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Ошибка подписчика на изменения каталога")
+
+
+def prune_changes(retention=None, shard=0):
+    """Удаляет изменения старше последних retention (по умолчанию CHANGES_RETENTION)"""
+    retention = CHANGES_RETENTION if retention is None else retention
+    # Как и вставки, ждет блокировку записи, занятую другими процессами
+    conn = _writer_connection(shard)
+    try:
+        conn.execute(
+            "DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?",
+            (retention,)
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def parse_change_cursor(value):
+    """
+    Разбирает номер для возобновления ленты изменений в список seq по шардам:
+    число без шардирования, номера шардов через точку при шардировании ("120.98.131").
+    Некорректный номер - ValueError
+    """
+    if value is None:
+        return None
+    cursor = [int(part) for part in str(value).split(".")]
+    if len(cursor) != SHARDS or min(cursor) < 0:
+        raise ValueError(f"Номер изменения должен содержать {SHARDS} неотрицательных чисел через точку")
+    return cursor
+
+
+def format_change_cursor(cursor):
+    """Номер для возобновления ленты: число без шардирования, строка при шардировании"""
+    return cursor[0] if SHARDS == 1 else ".".join(str(seq) for seq in cursor)
+
+
+def change_bounds():
+    """Для каждого шарда (первый хранимый seq, последний seq); (0, 0), если изменений нет"""
+    bounds = []
+    for shard in range(SHARDS):
+        conn = get_connection(shard)
+        oldest, latest = conn.execute("SELECT MIN(seq), MAX(seq) FROM changes").fetchone()
+        conn.close()
+        bounds.append((oldest or 0, latest or 0))
+    return bounds
+
+
+def get_changes(since, limit=100):
+    """
+    Возвращает не больше limit изменений после cursor since (список seq по шардам),
+    внутри шарда - в порядке возрастания seq.
+    product - текущее состояние товара (None, если товар удален).
+    При шардировании изменение содержит номер шарда shard и cursor для возобновления
+    """
+    changes = []
+    cursor = list(since)
+    for shard in range(SHARDS):
+        if len(changes) >= limit:
+            break
+        conn = get_connection(shard)
+        rows = conn.execute(
+            """
+            SELECT c.seq, c.op, c.product_id, p.name, p.category, p.price
+            FROM changes c LEFT JOIN products p ON p.id = c.product_id
+            WHERE c.seq > ? ORDER BY c.seq LIMIT ?
+            """,
+            (since[shard], limit - len(changes))
+        ).fetchall()
+        conn.close()
+        for row in rows:
+            change = {
+                "seq": row["seq"],
+                "op": row["op"],
+                "product_id": row["product_id"],
+                "product": {
+                    "id": row["product_id"],
+                    "name": row["name"],
+                    "category": row["category"],
+                    "price": row["price"]
+                } if row["name"] is not None else None
+            }
+            if SHARDS > 1:
+                cursor[shard] = row["seq"]
+                change["shard"] = shard
+                change["cursor"] = format_change_cursor(cursor)
+            changes.append(change)
+    return changes
+
+
+def get_fuzzy_index():
+    """Возвращает индекс нечеткого поиска, дозагрузив в него новые товары"""
+    global _fuzzy_index
+    if _fuzzy_index is None:
+        with _init_lock:
+            if _fuzzy_index is None:
+                from fuzzy import FuzzyIndex
+                _fuzzy_index = FuzzyIndex()
+    for shard in range(SHARDS):
+        conn = get_connection(shard)
+        _fuzzy_index.load(conn, shard)
+        conn.close()
+    return _fuzzy_index
+
+
+def get_prefix_index():
+    """Возвращает индекс автодополнения, дозагрузив в него новые товары"""
+    global _prefix_index
+    if _prefix_index is None:
+        with _init_lock:
+            if _prefix_index is None:
+                from suggest import PrefixIndex
+                _prefix_index = PrefixIndex()
+    for shard in range(SHARDS):
+        conn = get_connection(shard)
+        _prefix_index.load(conn, shard)
+        conn.close()
+    return _prefix_index
+
+
+# Поля товара в порядке столбцов таблицы
+PRODUCT_FIELDS = ("id", "name", "category", "price")
+
+
+def _columns(fields):
+    """Список столбцов SELECT для проекции fields (None - все столбцы)"""
+    if fields is None:
+        return "*"
+    unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Неизвестные поля товара: {', '.join(unknown)}")
+    return ", ".join(fields)
+
+
+def _row_factory(fields, rows):
+    """Кортежи (rows=True), Product для всех столбцов или словари для проекции fields"""
+    if rows:
+        return None
+    if fields is None:
+        return product_row
+    return _dict_row
+
+
+def _dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _fetch_products(sql, params, fields=None, rows=False, shard=0):
+    """
+    Выполняет запрос товаров. Без проекции возвращает список Product,
+    с проекцией fields - словари выбранных полей, при rows=True - кортежи значений
+    """
+    conn = get_connection(shard)
+    conn.row_factory = _row_factory(fields, rows)
+    products = conn.execute(sql, params).fetchall()
     conn.close()
     return products
 
 
-def find_product_by_name(name):
+def _shape_rows(values, fields, rows):
+    """Кортежи (id, name, category, price) в вид, который вернул бы _fetch_products"""
+    if fields is None:
+        return values if rows else [product_row(None, row) for row in values]
+    indexes = [PRODUCT_FIELDS.index(field) for field in fields]
+    if rows:
+        return [tuple(row[index] for index in indexes) for row in values]
+    return [{field: row[index] for field, index in zip(fields, indexes)} for row in values]
+
+
+def _select_products(where, params, order_by, limit, offset, fields, rows, shard=None):
+    """
+    SELECT товаров с условием where (" WHERE ..." или "") и сортировкой/пагинацией.
+    При шардировании запрос выполняется параллельно во всех шардах (или только в shard):
+    каждый шард возвращает первые offset + limit строк в порядке ORDER_BY,
+    результаты сливаются, и OFFSET/LIMIT применяются к общему порядку
+    """
+    if SHARDS == 1:
+        order_sql, order_params = _order_and_limit(order_by, limit, offset)
+        return _fetch_products(
+            f"SELECT {_columns(fields)} FROM products{where}" + order_sql,
+            tuple(params) + order_params,
+            fields,
+            rows
+        )
+    
+    targets = range(SHARDS) if shard is None else [shard]
+    order_sql, order_params = _order_and_limit(order_by, None if limit is None else offset + limit)
+    params = tuple(params) + order_params
+    
+    if limit is None or not offset:
+        # Все столбцы: по ним сливаются результаты шардов, проекция - после слияния
+        sql = f"SELECT id, name, category, price FROM products{where}" + order_sql
+        results = get_shard_pool().map(lambda shard: _fetch_products(sql, params, rows=True, shard=shard), targets)
+        return _shape_rows(shards.merge_sorted(results, order_by, limit, offset), fields, rows)
+    
+    # Дальние страницы: шарды возвращают offset + limit ключей сортировки, а строки
+    # читаются только для limit товаров итоговой страницы
+    sql = f"SELECT {shards.SORT_COLUMNS[order_by]} FROM products{where}" + order_sql
+    results = get_shard_pool().map(lambda shard: _fetch_products(sql, params, rows=True, shard=shard), targets)
+    page = shards.merge_sorted(results, order_by, limit, offset, sort_keys=True)
+    by_id = {row[shards.ID]: row for row in _rows_by_ids([key[-1] for key in page])}
+    return _shape_rows([by_id[key[-1]] for key in page if key[-1] in by_id], fields, rows)
+
+
+def _rows_by_ids(product_ids):
+    """Кортежи (id, name, category, price) товаров с указанными ID из их шардов"""
+    by_shard = {}
+    for product_id in product_ids:
+        by_shard.setdefault(shards.shard_for_id(product_id, SHARDS), []).append(product_id)
+    
+    def query(shard):
+        ids = by_shard[shard]
+        placeholders = ", ".join("?" * len(ids))
+        return _fetch_products(
+            f"SELECT id, name, category, price FROM products WHERE id IN ({placeholders})",
+            tuple(ids), rows=True, shard=shard
+        )
+    
+    return [row for result in get_shard_pool().map(query, by_shard) for row in result]
+
+
+def _order_and_limit(order_by, limit, offset=0):
+    """Возвращает ORDER BY/LIMIT/OFFSET часть запроса и параметры для нее"""
+    sql = f" ORDER BY {ORDER_BY[order_by]}"
+    if limit is None:
+        if offset:
+            return sql + " LIMIT -1 OFFSET ?", (offset,)
+        return sql, ()
+    return sql + " LIMIT ? OFFSET ?", (limit, offset)
+
+
+def get_all_products(order_by="id", limit=None, offset=0, fields=None, rows=False):
+    """
+    Возвращает все товары из БД.
+    fields - возвращаемые поля (проекция в SQL), rows=True - кортежи вместо словарей
+    """
+    _columns(fields)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.select(order_by=order_by, limit=limit, offset=offset, fields=fields, rows=rows)
+    
+    return _select_products("", (), order_by, limit, offset, fields, rows)
+
+
+def find_product_by_name(name, order_by="name", limit=None, offset=0, fields=None, rows=False):
     """Ищет товары по имени (частичное совпадение)"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT * FROM products WHERE name LIKE ? ORDER BY name",
-        (f"%{name}%",)
-    )
-    products = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return products
+    _columns(fields)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.select(name=name, order_by=order_by, limit=limit, offset=offset,
+                               fields=fields, rows=rows)
+    
+    return _select_products(" WHERE name LIKE ?", (f"%{name}%",), order_by, limit, offset, fields, rows)
+
 
+def fuzzy_find_products(query, limit=10, fields=None):
+    """Нечеткий поиск по названию (устойчив к опечаткам), товары с оценкой похожести"""
+    _columns(fields)
+    matches = get_fuzzy_index().search(query, limit)
+    products = find_products_by_ids([product_id for product_id, _ in matches])
+    by_id = {product.id: product for product in products}
+    result = []
+    for product_id, score in matches:
+        product = by_id.get(product_id)
+        if product:
+            # Результат небольшой, поэтому сразу словарь с оценкой похожести
+            product = product.as_dict()
+            if fields is not None:
+                product = {field: product[field] for field in fields}
+            product["score"] = score
+            result.append(product)
+    return result
 
-def find_products_by_category(category):
+
+def suggest_products(prefix, limit=10):
+    """Автодополнение: категории и товары, название которых начинается с prefix"""
+    suggestions = get_prefix_index().suggest(prefix, limit)
+    products = find_products_by_ids(suggestions["product_ids"])
+    by_id = {product.id: product for product in products}
+    return {
+        "categories": suggestions["categories"],
+        "products": [by_id[product_id] for product_id in suggestions["product_ids"] if product_id in by_id]
+    }
+
+
+def find_products_by_category(category, order_by="name", limit=None, offset=0, fields=None, rows=False):
     """Ищет товары по категории"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT * FROM products WHERE category LIKE ? ORDER BY name",
-        (f"%{category}%",)
+    _columns(fields)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.select(category=category, order_by=order_by, limit=limit, offset=offset,
+                               fields=fields, rows=rows)
+    
+    return _select_products(
+        " WHERE category LIKE ?", (f"%{category}%",), order_by, limit, offset, fields, rows
     )
-    products = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return products
 
 
-def find_product_by_id(product_id):
+def find_products_by_price_range(min_price=None, max_price=None, category=None,
+                                 order_by="price", limit=None, offset=0, fields=None, rows=False):
+    """
+    Ищет товары в диапазоне цен (границы включительно).
+    Категория сравнивается точно, чтобы запрос шел по индексу (category, price).
+    """
+    _columns(fields)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.select(
+            category_equals=category, min_price=min_price, max_price=max_price,
+            order_by=order_by, limit=limit, offset=offset, fields=fields, rows=rows
+        )
+    
+    conditions = []
+    params = []
+    shard = None
+    if category is not None:
+        conditions.append("category = ?")
+        params.append(category)
+        # При SHARD_BY=category все товары категории лежат в одном шарде
+        shard = get_router().for_category(category) if SHARDS > 1 else None
+    if min_price is not None:
+        conditions.append("price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("price <= ?")
+        params.append(max_price)
+    
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return _select_products(where, params, order_by, limit, offset, fields, rows, shard)
+
+
+def find_product_by_id(product_id, fields=None):
     """Ищет товар по ID"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    row = cursor.fetchone()
+    columns = _columns(fields)
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot.find_by_id(product_id, fields)
+    
+    shard = 0
+    if SHARDS > 1:
+        try:
+            shard = shards.shard_for_id(int(product_id), SHARDS)
+        except (TypeError, ValueError):
+            return None
+    
+    conn = get_connection(shard)
+    conn.row_factory = _row_factory(fields, False)
+    product = conn.execute(f"SELECT {columns} FROM products WHERE id = ?", (product_id,)).fetchone()
     conn.close()
-    return dict(row) if row else None
+    return product
 
 
-def add_product(name, category, price):
-    """Добавляет новый товар в БД"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO products (name, category, price) VALUES (?, ?, ?)",
-        (name, category, price)
-    )
-    product_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return find_product_by_id(product_id)
+def find_products_by_ids(product_ids):
+    """Возвращает товары с указанными ID (порядок не гарантируется)"""
+    if not product_ids:
+        return []
+    
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        products = [snapshot.find_by_id(product_id) for product_id in product_ids]
+        return [product for product in products if product]
+    
+    if SHARDS == 1:
+        placeholders = ", ".join("?" * len(product_ids))
+        return _fetch_products(f"SELECT * FROM products WHERE id IN ({placeholders})", tuple(product_ids))
+    
+    return _shape_rows(_rows_by_ids(product_ids), None, False)
+
 
+def _writer_connection(shard=0):
+    """Соединение потока-писателя: ждет блокировку записи вместо ошибки database is locked"""
+    conn = get_connection(shard)
+    conn.execute(f"PRAGMA busy_timeout = {WRITE_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+def get_writer(shard=0):
+    """Возвращает поток-писатель групповой фиксации (шарда shard)"""
+    writer = _writers.get(shard)
+    if writer is None:
+        with _init_lock:
+            writer = _writers.get(shard)
+            if writer is None:
+                options = {}
+                if SHARDS > 1:
+                    # ID выдает шард: ID mod SHARDS определяет шард товара
+                    options = {
+                        "insert_sql": shards.INSERT_PRODUCT,
+                        "insert_prefix": shards.insert_prefix(shard, SHARDS)
+                    }
+                writer = _writers[shard] = GroupCommitWriter(
+                    lambda: _writer_connection(shard),
+                    lambda: _after_write(shard),
+                    max_batch=WRITE_BATCH_MAX,
+                    window=WRITE_BATCH_WINDOW_MS / 1000,
+                    **options
+                )
+    return writer
+
+
+def write_metrics():
+    """
+    Метрики групповой фиксации или None, если записей еще не было.
+    При шардировании - метрики по шардам
+    """
+    if SHARDS == 1:
+        return _writers[0].stats() if 0 in _writers else None
+    if not _writers:
+        return None
+    return {str(shard): writer.stats() for shard, writer in sorted(_writers.items())}
+
+
+def add_product(name, category, price):
+    """
+    Добавляет новый товар в БД (в шард, выбранный по SHARD_BY).
+    Одновременные вставки фиксируются группами одним потоком-писателем (см. group_commit.py)
+    """
+    shard = get_router().for_insert(category) if SHARDS > 1 else 0
+    return get_writer(shard).insert(name, category, price)
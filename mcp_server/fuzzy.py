@@ -0,0 +1,142 @@
+"""
+Нечеткий поиск товаров по названию
+Индекс триграмм по словам названий: опечатки вроде "малако" или "памидоры"
+находят "Молоко 3.2%" и "Помидоры" без полного перебора каталога
+"""
+
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, List, Set, Tuple
+
+_WORD_RE = re.compile(r"[0-9a-zа-я]+")
+
+# Сколько слов-кандидатов (по числу общих триграмм) проверять расстоянием Левенштейна
+CANDIDATES_PER_WORD = 50
+
+# Минимальная похожесть товара на запрос (0..1)
+MIN_SCORE = 0.5
+
+
+def normalize(text: str) -> List[str]:
+    """Приводит строку к списку слов: нижний регистр, ё → е, без знаков препинания"""
+    return _WORD_RE.findall(text.lower().replace("ё", "е"))
+
+
+def trigrams(word: str) -> Set[str]:
+    """Триграммы слова с отступами по краям (как в pg_trgm)"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a: str, b: str, max_distance: int) -> int:
+    """Расстояние Левенштейна с отсечением: возвращает max_distance + 1, если больше"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def word_similarity(query: str, word: str) -> float:
+    """Похожесть слов 0..1; префикс ("мол" → "молоко") ценится почти как полное совпадение"""
+    if query == word:
+        return 1.0
+    if len(query) >= 3 and word.startswith(query):
+        return 0.9
+    longest = max(len(query), len(word))
+    max_distance = longest // 2
+    distance = levenshtein(query, word, max_distance)
+    if distance > max_distance:
+        return 0.0
+    return 1.0 - distance / longest
+
+
+class FuzzyIndex:
+    """
+    Индекс для нечеткого поиска:
+    - words: слово → ID товаров, в названии которых оно встречается
+    - grams: триграмма → слова, содержащие ее
+    """
+
+    def __init__(self):
+        self.words: Dict[str, array] = {}
+        self.grams: Dict[str, Set[str]] = {}
+        # Последний загруженный ID по шардам каталога
+        self.last_ids: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def load(self, conn, shard: int = 0) -> int:
+        """Дозагружает названия товаров шарда с id больше последнего загруженного"""
+        with self._lock:
+            rows = conn.execute(
+                "SELECT id, name FROM products WHERE id > ? ORDER BY id",
+                (self.last_ids.get(shard, 0),)
+            ).fetchall()
+            for product_id, name in rows:
+                self._add(product_id, name)
+            if rows:
+                self.last_ids[shard] = rows[-1][0]
+        return len(rows)
+
+    def _add(self, product_id: int, name: str):
+        for word in set(normalize(name)):
+            ids = self.words.get(word)
+            if ids is None:
+                ids = self.words[word] = array("q")
+                for gram in trigrams(word):
+                    self.grams.setdefault(gram, set()).add(word)
+            ids.append(product_id)
+
+    def _match_word(self, query: str) -> List[Tuple[str, float]]:
+        """Слова индекса, похожие на слово запроса, с оценкой похожести"""
+        overlap = Counter()
+        for gram in trigrams(query):
+            for word in self.grams.get(gram, ()):
+                overlap[word] += 1
+        matches = []
+        for word, _ in overlap.most_common(CANDIDATES_PER_WORD):
+            score = word_similarity(query, word)
+            if score > 0:
+                matches.append((word, score))
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """
+        Возвращает пары (ID товара, оценка) по убыванию оценки.
+        Оценка товара - среднее по словам запроса лучшей похожести среди слов названия.
+        """
+        query_words = normalize(query)
+        if not query_words:
+            return []
+
+        with self._lock:
+            scores: Dict[int, float] = {}
+            for query_word in query_words:
+                best: Dict[int, float] = {}
+                for word, score in self._match_word(query_word):
+                    for product_id in self.words[word]:
+                        if score > best.get(product_id, 0.0):
+                            best[product_id] = score
+                for product_id, score in best.items():
+                    scores[product_id] = scores.get(product_id, 0.0) + score
+
+        count = len(query_words)
+        ranked = [
+            (product_id, round(total / count, 3))
+            for product_id, total in scores.items()
+            if total / count >= MIN_SCORE
+        ]
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
@@ -0,0 +1,164 @@
+"""
+Групповая фиксация записей (group commit)
+Один поток-писатель собирает вставки из всех потоков и фиксирует их
+одной транзакцией: одна синхронизация с диском и одно взятие блокировки
+записи SQLite на группу вместо каждой строки
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+from product import Product
+
+logger = logging.getLogger("group_commit")
+
+INSERT_PRODUCT = "INSERT INTO products (name, category, price) VALUES (?, ?, ?)"
+
+
+class GroupCommitWriter:
+    """
+    Очередь вставок товаров с одним потоком-писателем.
+    Писатель ждет первую вставку, затем до window секунд добирает следующие
+    (не больше max_batch) и фиксирует группу. Каждый вызывающий получает свою строку.
+    """
+
+    def __init__(self, connect: Callable, after_commit: Callable[[], None],
+                 max_batch: int = 100, window: float = 0.002,
+                 insert_sql: str = INSERT_PRODUCT, insert_prefix: tuple = ()):
+        self.connect = connect
+        self.after_commit = after_commit
+        self.max_batch = max_batch
+        self.window = window
+        # SQL вставки и параметры перед (name, category, price): шарды выдают ID сами
+        self.insert_sql = insert_sql
+        self.insert_prefix = insert_prefix
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.metrics = {
+            "commits": 0,
+            "rows": 0,
+            "failed_rows": 0,
+            "max_batch_size": 0,
+            "commit_ms_total": 0.0,
+            "commit_ms_max": 0.0,
+        }
+        # Сколько групп какого размера зафиксировано: 1, 2-4, 5-16, 17-64, 65+
+        self.batch_sizes = {"1": 0, "2-4": 0, "5-16": 0, "17-64": 0, "65+": 0}
+
+    def insert(self, name: str, category: str, price: float) -> Product:
+        """Ставит вставку в очередь и ждет фиксации группы; возвращает добавленный товар"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put(((name, category, price), future))
+        return future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики: число групп и строк, размеры групп, время фиксации"""
+        commits = self.metrics["commits"]
+        return {
+            **self.metrics,
+            "avg_batch_size": round(self.metrics["rows"] / commits, 2) if commits else 0,
+            "commit_ms_avg": round(self.metrics["commit_ms_total"] / commits, 3) if commits else 0,
+            "batch_sizes": dict(self.batch_sizes),
+            "pending": self._queue.qsize(),
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[Tuple[tuple, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = self._collect()
+            try:
+                if conn is None:
+                    conn = self.connect()
+                results = self._commit(conn, batch)
+            except Exception as e:
+                logger.warning("Ошибка фиксации группы из %s строк: %s", len(batch), e)
+                results = self._commit_each(conn, batch, e)
+
+            # Индексы обновляются до ответа вызывающим: сразу после add_product
+            # новый товар виден в снимке и поиске
+            try:
+                self.after_commit()
+            except Exception:
+                logger.exception("Ошибка обновления индексов после записи")
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _commit_each(self, conn, batch: List[Tuple[tuple, Future]], error: Exception) -> list:
+        """
+        Группа откатывается целиком; строки повторяются по одной,
+        чтобы ошибка одной вставки не затронула остальных
+        """
+        if conn is None:
+            self.metrics["failed_rows"] += len(batch)
+            return [error] * len(batch)
+        conn.rollback()
+        results = []
+        for item in batch:
+            try:
+                results.extend(self._commit(conn, [item]))
+            except Exception as item_error:
+                conn.rollback()
+                self.metrics["failed_rows"] += 1
+                results.append(item_error)
+        return results
+
+    def _commit(self, conn, batch: List[Tuple[tuple, Future]]) -> List[Product]:
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        rows = []
+        for values, _ in batch:
+            cursor.execute(self.insert_sql, self.insert_prefix + values)
+            name, category, price = values
+            # price REAL: SQLite хранит целую цену как число с плавающей точкой
+            rows.append(Product(cursor.lastrowid, name, category, float(price)))
+        conn.commit()
+        self._record(len(batch), (time.perf_counter() - start) * 1000)
+        return rows
+
+    def _record(self, size: int, elapsed_ms: float):
+        metrics = self.metrics
+        metrics["commits"] += 1
+        metrics["rows"] += size
+        metrics["max_batch_size"] = max(metrics["max_batch_size"], size)
+        metrics["commit_ms_total"] += elapsed_ms
+        metrics["commit_ms_max"] = max(metrics["commit_ms_max"], elapsed_ms)
+        if size == 1:
+            bucket = "1"
+        elif size <= 4:
+            bucket = "2-4"
+        elif size <= 16:
+            bucket = "5-16"
+        elif size <= 64:
+            bucket = "17-64"
+        else:
+            bucket = "65+"
+        self.batch_sizes[bucket] += 1
@@ -5,18 +5,74 @@ HTTP обертка для MCP сервера
 Запуск: python http_server.py
 """
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import logging
+import os
+# fastapi и pydantic импортируются сразу: приложение app и его маршруты создаются
+# при импорте модуля (uvicorn http_server:app ожидает готовый app), а stdio-сервер
+# (server.py) этот модуль не импортирует. Отложен только uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Any, Dict, Optional
-import uvicorn
+from typing import Any, Dict, List, Optional, Union
 import db
+import product
+import server
 import tools
+from log_setup import set_request_id, setup_logging
 
-# Инициализация БД
-db.init_db()
+logger = logging.getLogger("http_server")
+
+# БД инициализируется лениво при первом запросе (см. db.get_connection)
 
 app = FastAPI(title="Product MCP HTTP Server", version="1.0.0")
 
+# Инструменты с побочными эффектами: одинаковые вызовы выполняются каждый отдельно
+WRITE_TOOLS = {"add_product"}
+
+# Сколько секунд запрос ждет результат уже выполняющегося одинакового запроса,
+# прежде чем выполнить инструмент самостоятельно
+COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", "5"))
+
+# Лента изменений: как часто перечитывать таблицу changes без уведомления
+# (записи других процессов), как часто слать keepalive и сколько изменений читать за раз
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "1"))
+CHANGES_KEEPALIVE = float(os.getenv("CHANGES_KEEPALIVE", "15"))
+CHANGES_BATCH = 500
+
+# Событие «в каталоге есть новые записи»; заменяется новым при каждом уведомлении
+_changes_signal: Optional[asyncio.Event] = None
+
+# MCP JSON-RPC по WebSocket: сколько запросов одного соединения выполняется одновременно
+# (при превышении чтение следующих сообщений приостанавливается)
+WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", "32"))
+
+# Разрешенные заголовки Origin для /mcp (через запятую). Запросы без Origin
+# (не из браузера) принимаются всегда; защита от DNS rebinding
+MCP_ALLOWED_ORIGINS = {
+    origin.strip() for origin in os.getenv("MCP_ALLOWED_ORIGINS", "").split(",") if origin.strip()
+}
+
+# Метрики транспортов JSON-RPC
+jsonrpc_metrics = {
+    "http_requests": 0,
+    "ws_connections": 0,
+    "ws_messages": 0,
+    "ws_inflight": 0,
+}
+
+# Выполняющиеся запросы на чтение: ключ (инструмент + аргументы) → задача с готовым JSON
+_inflight: Dict[str, asyncio.Task] = {}
+
+# Метрики объединения запросов
+coalesce_metrics = {
+    "executed": 0,
+    "coalesced": 0,
+    "wait_timeouts": 0,
+}
+
 
 class ToolCallRequest(BaseModel):
     name: str
@@ -24,11 +80,29 @@ class ToolCallRequest(BaseModel):
 
 
 class ToolCallResponse(BaseModel):
+    """
+    Схема ответа /tools/call только для документации OpenAPI (/docs): обработчик
+    возвращает готовый JSON (Response), и FastAPI не проверяет его по этой модели
+    """
     success: bool
     result: Optional[Any] = None
     error: Optional[str] = None
     count: Optional[int] = None
     message: Optional[str] = None
+    next_cursor: Optional[str] = None
+    expression: Optional[str] = None
+
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """
+    Берет ID запроса из заголовка X-Request-ID (его передает бот) или создает новый,
+    помечает им записи в логе и возвращает в заголовке ответа
+    """
+    request_id = set_request_id(request.headers.get("X-Request-ID"))
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
 
 
 @app.get("/")
@@ -47,18 +121,272 @@ async def list_tools():
     return {"tools": tools.MCP_TOOLS}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Метрики объединения запросов, групповой фиксации записей и транспортов JSON-RPC"""
+    return {
+        **coalesce_metrics,
+        "inflight": len(_inflight),
+        "writes": db.write_metrics(),
+        "jsonrpc": jsonrpc_metrics,
+    }
+
+
+async def execute_encoded(name: str, arguments: Dict[str, Any]) -> bytes:
+    """Выполняет инструмент в пуле потоков и кодирует ответ в JSON один раз"""
+    coalesce_metrics["executed"] += 1
+    result = await run_in_threadpool(tools.execute_tool, name, arguments)
+    # Товары (Product) превращаются в словари только во время записи JSON
+    return product.dumps(result).encode("utf-8")
+
+
+async def execute_coalesced(name: str, arguments: Dict[str, Any]) -> bytes:
+    """
+    Одинаковые одновременные запросы на чтение выполняются один раз:
+    остальные ждут тот же результат и получают те же байты ответа
+    """
+    key = name + "\0" + json.dumps(arguments, ensure_ascii=False, sort_keys=True)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(execute_encoded(name, arguments))
+        _inflight[key] = task
+        task.add_done_callback(lambda done: _inflight.pop(key) if _inflight.get(key) is done else None)
+        return await asyncio.shield(task)
+    
+    try:
+        body = await asyncio.wait_for(asyncio.shield(task), COALESCE_WAIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        coalesce_metrics["wait_timeouts"] += 1
+        logger.warning("Не дождались одинакового запроса %s за %s с", name, COALESCE_WAIT_TIMEOUT)
+        return await execute_encoded(name, arguments)
+    coalesce_metrics["coalesced"] += 1
+    return body
+
+
+def _wake_change_subscribers():
+    global _changes_signal
+    signal, _changes_signal = _changes_signal, asyncio.Event()
+    signal.set()
+
+
+def _subscribe_changes() -> asyncio.Event:
+    """Возвращает событие, которое сработает при следующей записи в каталог этим процессом"""
+    global _changes_signal
+    if _changes_signal is None:
+        _changes_signal = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        # Слушатель вызывается из потока-писателя БД
+        db.add_change_listener(lambda: loop.call_soon_threadsafe(_wake_change_subscribers))
+    return _changes_signal
+
+
+def sse_event(event: str, data: Dict[str, Any], event_id: Optional[Any] = None) -> str:
+    """Форматирует событие Server-Sent Events"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False))
+    return "\n".join(lines) + "\n\n"
+
+
+async def change_stream(request: Request, since: Optional[List[int]]):
+    """
+    Поток изменений каталога. Сначала событие sync с номером, с которого идет лента,
+    или reset, если запрошенные изменения уже удалены (клиенту нужно перечитать каталог).
+    Затем событие change на каждое изменение; его id - номер для возобновления.
+    При шардировании номер - seq всех шардов через точку (см. db.parse_change_cursor)
+    """
+    bounds = await run_in_threadpool(db.change_bounds)
+    latest = [last for _, last in bounds]
+    if since is None:
+        since = latest
+        yield sse_event("sync", {"seq": db.format_change_cursor(since)})
+    elif any(seq > last or (oldest and seq < oldest - 1) for seq, (oldest, last) in zip(since, bounds)):
+        since = latest
+        yield sse_event("reset", {"seq": db.format_change_cursor(since)})
+    else:
+        yield sse_event("sync", {"seq": db.format_change_cursor(since)})
+    
+    loop = asyncio.get_running_loop()
+    last_sent = loop.time()
+    while True:
+        # Событие берется до чтения, чтобы не пропустить запись, сделанную во время чтения
+        signal = _subscribe_changes()
+        changes = await run_in_threadpool(db.get_changes, since, CHANGES_BATCH)
+        for change in changes:
+            since[change.get("shard", 0)] = change["seq"]
+            yield sse_event("change", change, event_id=db.format_change_cursor(since))
+        if changes:
+            last_sent = loop.time()
+            if len(changes) == CHANGES_BATCH:
+                continue
+        
+        if await request.is_disconnected():
+            return
+        if loop.time() - last_sent >= CHANGES_KEEPALIVE:
+            yield ": keepalive\n\n"
+            last_sent = loop.time()
+        try:
+            await asyncio.wait_for(signal.wait(), CHANGES_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+@app.get("/changes")
+async def changes(request: Request, since: Optional[str] = None):
+    """
+    Лента изменений каталога (Server-Sent Events).
+    Возобновление: параметр since или заголовок Last-Event-ID (его отправляет EventSource)
+    """
+    since = request.headers.get("Last-Event-ID") or since
+    try:
+        cursor = db.parse_change_cursor(since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Некорректный номер изменения: {e}")
+    return StreamingResponse(
+        change_stream(request, cursor),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/tools/call", response_model=ToolCallResponse)
 async def call_tool(request: ToolCallRequest):
     """Вызывает MCP инструмент"""
     try:
-        result = tools.execute_tool(request.name, request.arguments)
-        return ToolCallResponse(**result)
+        if request.name in WRITE_TOOLS:
+            body = await execute_encoded(request.name, request.arguments)
+        else:
+            body = await execute_coalesced(request.name, request.arguments)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
+        logger.exception("Ошибка вызова инструмента %s", request.name)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+
+def jsonrpc_error(code: int, message: str, request_id: Any = None) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+async def process_jsonrpc(message: Any) -> Optional[Dict[str, Any]]:
+    """Выполняет одно сообщение JSON-RPC в пуле потоков; для уведомлений возвращает None"""
+    if isinstance(message, dict) and "method" not in message and ("result" in message or "error" in message):
+        # Ответ клиента на запрос сервера: сервер таких запросов не отправляет
+        return None
+    if not isinstance(message, dict) or not isinstance(message.get("method"), str):
+        return jsonrpc_error(-32600, "Некорректный запрос JSON-RPC",
+                             message.get("id") if isinstance(message, dict) else None)
+    if server.is_notification(message):
+        return None
+    return await run_in_threadpool(server.process_mcp_request, message)
+
+
+async def process_jsonrpc_payload(payload: Any) -> Optional[Union[Dict[str, Any], List[Dict[str, Any]]]]:
+    """Сообщение или пакет (массив) сообщений; сообщения пакета выполняются параллельно"""
+    if not isinstance(payload, list):
+        return await process_jsonrpc(payload)
+    if not payload:
+        return jsonrpc_error(-32600, "Пустой пакет JSON-RPC")
+    responses = await asyncio.gather(*(process_jsonrpc(message) for message in payload))
+    responses = [response for response in responses if response is not None]
+    return responses or None
+
+
+def origin_allowed(origin: Optional[str]) -> bool:
+    return origin is None or origin in MCP_ALLOWED_ORIGINS
+
+
+@app.post("/mcp")
+async def mcp_streamable_http(request: Request):
+    """
+    MCP streamable HTTP: сообщение JSON-RPC (или пакет) в теле POST, ответ - JSON.
+    Сервер не хранит сессий; на уведомления отвечает 202 без тела
+    """
+    if not origin_allowed(request.headers.get("Origin")):
+        return Response(status_code=403)
+    jsonrpc_metrics["http_requests"] += 1
+    try:
+        payload = json.loads(await request.body())
+    except ValueError as e:
+        return Response(
+            content=json.dumps(jsonrpc_error(-32700, f"Ошибка парсинга JSON: {str(e)}"), ensure_ascii=False),
+            status_code=400,
+            media_type="application/json"
+        )
+    
+    response = await process_jsonrpc_payload(payload)
+    if response is None:
+        return Response(status_code=202)
+    return Response(content=json.dumps(response, ensure_ascii=False), media_type="application/json")
+
+
+@app.get("/mcp")
+async def mcp_streamable_http_stream():
+    """Сервер не отправляет клиенту собственных сообщений, поэтому поток GET не поддерживается"""
+    return Response(status_code=405, headers={"Allow": "POST"})
+
+
+@app.websocket("/mcp/ws")
+async def mcp_websocket(websocket: WebSocket):
+    """
+    MCP JSON-RPC по постоянному WebSocket: одно текстовое сообщение - один запрос или пакет.
+    Запросы выполняются параллельно (до WS_MAX_INFLIGHT на соединение),
+    ответы отправляются по готовности и сопоставляются с запросами по id
+    """
+    if not origin_allowed(websocket.headers.get("Origin")):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept(subprotocol="mcp" if "mcp" in websocket.scope.get("subprotocols", []) else None)
+    jsonrpc_metrics["ws_connections"] += 1
+    
+    send_lock = asyncio.Lock()
+    slots = asyncio.Semaphore(WS_MAX_INFLIGHT)
+    pending = set()
+    
+    async def send(response):
+        async with send_lock:
+            await websocket.send_text(json.dumps(response, ensure_ascii=False))
+    
+    async def handle(payload):
+        try:
+            response = await process_jsonrpc_payload(payload)
+            if response is not None:
+                await send(response)
+        except Exception:
+            logger.exception("Ошибка обработки сообщения WebSocket")
+        finally:
+            slots.release()
+            jsonrpc_metrics["ws_inflight"] -= 1
+    
+    try:
+        while True:
+            text = await websocket.receive_text()
+            jsonrpc_metrics["ws_messages"] += 1
+            try:
+                payload = json.loads(text)
+            except ValueError as e:
+                await send(jsonrpc_error(-32700, f"Ошибка парсинга JSON: {str(e)}"))
+                continue
+            
+            await slots.acquire()
+            jsonrpc_metrics["ws_inflight"] += 1
+            task = asyncio.ensure_future(handle(payload))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        jsonrpc_metrics["ws_connections"] -= 1
+        for task in pending:
+            task.cancel()
+
+
 if __name__ == "__main__":
-    print("Запуск HTTP сервера MCP на http://localhost:8000")
-    print("Документация API: http://localhost:8000/docs")
+    import uvicorn
+    
+    setup_logging()
+    logger.info("Запуск HTTP сервера MCP на http://localhost:8000")
+    logger.info("Документация API: http://localhost:8000/docs")
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
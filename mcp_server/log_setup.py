@@ -0,0 +1,105 @@
+"""
+Настройка логирования MCP сервера
+Записи попадают в очередь и выводятся в stderr отдельным потоком (QueueListener):
+stdout stdio-сервера занят ответами JSON-RPC.
+Каждая запись содержит ID запроса: X-Request-ID от бота или id запроса JSON-RPC.
+Похожий модуль есть в telegram_bot/log_setup.py: сервер и бот разворачиваются и запускаются
+отдельно (свой каталог и requirements.txt) и не импортируют код друг друга.
+"""
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import uuid
+
+# Уровень логирования (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Доля DEBUG-записей, попадающих в лог (0.0-1.0)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# Значение ID вне обработки запроса (запуск, фоновые задачи)
+NO_REQUEST_ID = "-"
+
+# Максимальная длина ID, принимаемого от клиента
+MAX_REQUEST_ID_LENGTH = 64
+
+# ID текущего запроса; наследуется задачами asyncio и пулом потоков FastAPI
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=NO_REQUEST_ID)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+_listener = None
+
+
+def new_request_id() -> str:
+    """Создает новый ID запроса"""
+    return uuid.uuid4().hex[:12]
+
+
+def set_request_id(request_id) -> str:
+    """Делает ID текущим; пустой ID заменяется новым, слишком длинный обрезается"""
+    request_id = str(request_id)[:MAX_REQUEST_ID_LENGTH] if request_id not in (None, "") else new_request_id()
+    request_id_var.set(request_id)
+    return request_id
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет в запись ID текущего запроса"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает только долю DEBUG-записей; записи уровня INFO и выше проходят всегда"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладет в очередь саму запись. Стандартный prepare() форматирует сообщение
+    и traceback в вызывающем потоке; здесь это делает поток вывода (QueueListener)
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, debug_sample_rate: float = LOG_DEBUG_SAMPLE_RATE):
+    """
+    Настраивает корневой логгер: запись в очередь в вызывающем потоке, вывод в фоновом.
+    Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    handler = RecordQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    if debug_sample_rate < 1.0:
+        handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -0,0 +1,53 @@
+"""
+Компактное представление товара
+Строки таблицы products хранятся объектами с __slots__ вместо словарей,
+а в словарь товар превращается только при сериализации в JSON
+"""
+
+import json
+import sys
+from typing import Any, Dict
+
+
+class Product:
+    """Товар: четыре слота без __dict__ (64 байта на объект против ~200 у словаря из 4 ключей)"""
+
+    __slots__ = ("id", "name", "category", "price")
+
+    def __init__(self, id: int, name: str, category: str, price: float):
+        self.id = id
+        self.name = name
+        self.category = category
+        self.price = price
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "name": self.name, "category": self.category, "price": self.price}
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Product):
+            return (self.id, self.name, self.category, self.price) == \
+                (other.id, other.name, other.category, other.price)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Product(id={self.id!r}, name={self.name!r}, category={self.category!r}, price={self.price!r})"
+
+
+def product_row(cursor, row) -> Product:
+    """
+    row_factory для запросов SELECT * FROM products: категорий мало,
+    поэтому строки категорий интернируются и не дублируются в памяти
+    """
+    return Product(row[0], row[1], sys.intern(row[2]), row[3])
+
+
+def json_default(value):
+    """Сериализация товаров в json.dumps: словарь создается на время записи одного товара"""
+    if isinstance(value, Product):
+        return value.as_dict()
+    raise TypeError(f"Объект типа {type(value).__name__} не сериализуется в JSON")
+
+
+def dumps(value: Any, **kwargs) -> str:
+    """json.dumps с поддержкой Product"""
+    return json.dumps(value, ensure_ascii=False, default=json_default, **kwargs)
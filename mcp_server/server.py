@@ -7,17 +7,21 @@ MCP Server для работы с базой данных товаров
 import json
 import sys
 from typing import Any, Dict, List
-import db
-import tools
 
-# Инициализация БД при импорте
-db.init_db()
+# Модули db и tools импортируются лениво при первом вызове инструментов:
+# хост MCP запускает сервер на каждую сессию, и ответ на initialize
+# не должен ждать импорта и открытия БД.
+
+
+# Поддерживаемые версии протокола MCP (первая - предпочтительная)
+PROTOCOL_VERSIONS = ["2025-03-26", "2024-11-05"]
 
 
 def handle_initialize(params: Dict[str, Any]) -> Dict[str, Any]:
-    """Обработка запроса initialize"""
+    """Обработка запроса initialize: версия клиента, если поддерживается, иначе последняя"""
+    requested = params.get("protocolVersion")
     return {
-        "protocolVersion": "2024-11-05",
+        "protocolVersion": requested if requested in PROTOCOL_VERSIONS else PROTOCOL_VERSIONS[0],
         "capabilities": {
             "tools": {}
         },
@@ -30,12 +34,13 @@ def handle_initialize(params: Dict[str, Any]) -> Dict[str, Any]:
 
 def handle_list_tools(params: Dict[str, Any]) -> Dict[str, Any]:
     """Обработка запроса list_tools - возвращает список доступных инструментов"""
+    import tools
     return {
         "tools": tools.MCP_TOOLS
     }
 
 
-def handle_call_tool(params: Dict[str, Any]) -> Dict[str, Any]:
+def handle_call_tool(params: Dict[str, Any], request_id: Any = None) -> Dict[str, Any]:
     """Обработка запроса call_tool - выполняет инструмент"""
     tool_name = params.get("name")
     arguments = params.get("arguments", {})
@@ -51,13 +56,18 @@ def handle_call_tool(params: Dict[str, Any]) -> Dict[str, Any]:
             "isError": True
         }
     
+    import tools
+    import log_setup
+    # Записи в логе (stderr) помечаются id запроса JSON-RPC
+    log_setup.set_request_id(request_id)
+    import product
     result = tools.execute_tool(tool_name, arguments)
     
     return {
         "content": [
             {
                 "type": "text",
-                "text": json.dumps(result, ensure_ascii=False, indent=2)
+                "text": product.dumps(result, indent=2)
             }
         ],
         "isError": not result.get("success", False)
@@ -81,16 +91,18 @@ def process_mcp_request(request: Dict[str, Any]) -> Dict[str, Any]:
         elif method == "tools/list":
             result = handle_list_tools(params)
         elif method == "tools/call":
-            result = handle_call_tool(params)
+            result = handle_call_tool(params, request_id)
+        elif method == "ping":
+            result = {}
         else:
-            result = {
-                "error": {
-                    "code": -32601,
-                    "message": f"Метод не найден: {method}"
-                }
+            result = None
+            response["error"] = {
+                "code": -32601,
+                "message": f"Метод не найден: {method}"
             }
         
-        response.update(result)
+        if result is not None:
+            response["result"] = result
     
     except Exception as e:
         response["error"] = {
@@ -101,10 +113,19 @@ def process_mcp_request(request: Dict[str, Any]) -> Dict[str, Any]:
     return response
 
 
+def is_notification(message: Any) -> bool:
+    """Уведомление JSON-RPC (без id): ответ на него не отправляется"""
+    return isinstance(message, dict) and "method" in message and "id" not in message
+
+
 def main():
     """Основная функция - читает JSON-RPC запросы из stdin и отправляет ответы в stdout"""
-    # Инициализация БД
-    db.init_db()
+    # БД инициализируется лениво при первом обращении (см. db.get_connection)
+    
+    # Логирование настраивается один раз на процесс, здесь, а не в обработчиках:
+    # их же вызывает http_server (/mcp, /mcp/ws), где логирование настроено при запуске.
+    # Настройка (импорт logging) откладывается до первого запроса после initialize
+    logging_ready = False
     
     # Читаем запросы из stdin
     for line in sys.stdin:
@@ -114,6 +135,12 @@ def main():
         
         try:
             request = json.loads(line)
+            if is_notification(request):
+                continue
+            if not logging_ready and not (isinstance(request, dict) and request.get("method") == "initialize"):
+                import log_setup
+                log_setup.setup_logging()
+                logging_ready = True
             response = process_mcp_request(request)
             print(json.dumps(response, ensure_ascii=False))
             sys.stdout.flush()
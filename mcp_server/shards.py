@@ -0,0 +1,109 @@
+"""
+Шардирование каталога по нескольким файлам SQLite
+Шард k выдает ID вида k + 1 + N * i (N - число шардов), поэтому по ID
+сразу известен шард, где лежит товар, при любом способе распределения.
+Товары распределяются по шардам по очереди (by id) или по хешу категории.
+"""
+
+import heapq
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
+from typing import Callable, Iterable, List, Optional
+
+# Индексы столбцов в строках-кортежах (id, name, category, price)
+ID, NAME, CATEGORY, PRICE = range(4)
+
+# Ключи слияния отсортированных результатов шардов, совпадающие с ORDER_BY в db.py
+MERGE_KEYS = {
+    "id": lambda row: row[ID],
+    "name": lambda row: (row[NAME], row[ID]),
+    "price": lambda row: (row[PRICE], row[ID]),
+    "price_desc": lambda row: (row[PRICE], row[ID]),
+}
+
+# Только столбцы сортировки (ID последним): такие кортежи сравниваются без функции-ключа,
+# а для сортировки по цене их отдает покрывающий индекс idx_products_price без чтения строк
+SORT_COLUMNS = {
+    "id": "id",
+    "name": "name, id",
+    "price": "price, id",
+    "price_desc": "price, id",
+}
+
+# Следующий ID шарда: больше любого ID, когда-либо выданного в нем (sqlite_sequence
+# не уменьшается при удалении), и с тем же остатком от деления на число шардов
+INSERT_PRODUCT = """
+    INSERT INTO products (id, name, category, price) VALUES (
+        IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'products'), ?) + ?, ?, ?, ?
+    )
+"""
+
+
+def shard_path(db_path: str, shard: int) -> str:
+    """products.db → products.0.db, products.1.db, ..."""
+    base, ext = os.path.splitext(db_path)
+    return f"{base}.{shard}{ext}"
+
+
+def insert_prefix(shard: int, shards: int) -> tuple:
+    """Первые параметры INSERT_PRODUCT для шарда"""
+    return (shard + 1 - shards, shards)
+
+
+def shard_for_id(product_id: int, shards: int) -> int:
+    return (product_id - 1) % shards
+
+
+def shard_for_category(category: str, shards: int) -> int:
+    return zlib.crc32(category.encode("utf-8")) % shards
+
+
+class ShardRouter:
+    """Выбор шарда для новых товаров: по очереди (by="id") или по категории"""
+
+    def __init__(self, shards: int, by: str = "id"):
+        if by not in ("id", "category"):
+            raise ValueError("PRODUCTS_SHARD_BY должен быть id или category")
+        self.shards = shards
+        self.by = by
+        self._next = count()
+
+    def for_insert(self, category: str) -> int:
+        if self.by == "category":
+            return shard_for_category(category, self.shards)
+        # next() у itertools.count атомарен под GIL
+        return next(self._next) % self.shards
+
+    def for_category(self, category: str) -> Optional[int]:
+        """Шард с товарами точной категории или None, если товары категории есть во всех шардах"""
+        if self.by == "category":
+            return shard_for_category(category, self.shards)
+        return None
+
+
+class ShardPool:
+    """Параллельное выполнение запроса во всех шардах (sqlite3 отпускает GIL во время запроса)"""
+
+    def __init__(self, workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard")
+
+    def map(self, func: Callable[[int], list], shards: Iterable[int]) -> List[list]:
+        shards = list(shards)
+        if len(shards) == 1:
+            return [func(shards[0])]
+        return list(self._executor.map(func, shards))
+
+
+def merge_sorted(results: List[list], order_by: str, limit: Optional[int], offset: int,
+                 sort_keys: bool = False) -> list:
+    """
+    Сливает отсортированные результаты шардов в один порядок ORDER_BY[order_by]
+    и применяет OFFSET/LIMIT к общему результату.
+    Строки - полные кортежи (id, name, category, price) или, при sort_keys, кортежи SORT_COLUMNS
+    """
+    key = None if sort_keys else MERGE_KEYS[order_by]
+    merged = heapq.merge(*results, key=key, reverse=order_by == "price_desc")
+    end = None if limit is None else offset + limit
+    return list(islice(merged, offset, end))
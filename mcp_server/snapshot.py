@@ -0,0 +1,249 @@
+"""
+Колоночный снимок таблицы products в памяти
+Используется db.py для чтения без обращения к SQLite (включается PRODUCTS_SNAPSHOT=1)
+"""
+
+import bisect
+import functools
+import heapq
+import re
+import sys
+import threading
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence
+
+from product import Product
+
+# Таблица для приведения к нижнему регистру только ASCII-символов:
+# так же сравнивает оператор LIKE в SQLite
+_ASCII_LOWER = {code: code + 32 for code in range(ord("A"), ord("Z") + 1)}
+
+
+@functools.lru_cache(maxsize=256)
+def like_matcher(pattern: str) -> Callable[[str], bool]:
+    """
+    Функция-аналог SQL `value LIKE '%pattern%'`: % - любая последовательность символов,
+    _ - один символ, регистр не учитывается только для ASCII (ESCAPE в запросах не используется)
+    """
+    pattern = pattern.translate(_ASCII_LOWER)
+    if "%" not in pattern and "_" not in pattern:
+        return lambda value: pattern in value.translate(_ASCII_LOWER)
+    regex = re.compile(
+        "".join(".*" if char == "%" else "." if char == "_" else re.escape(char) for char in pattern),
+        re.DOTALL
+    )
+    return lambda value: regex.search(value.translate(_ASCII_LOWER)) is not None
+
+
+class CatalogSnapshot:
+    """
+    Снимок каталога в колоночном виде:
+    - ids, prices - массивы array('q') и array('d')
+    - category_codes - коды интернированных категорий (array('I'))
+    - names - все названия в одной строке, границы в name_offsets
+    - by_name - индексы строк, упорядоченные по названию (ORDER BY name)
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.ids = array("q")
+        self.prices = array("d")
+        self.category_codes = array("I")
+        self.categories: List[str] = []
+        self._category_index: Dict[str, int] = {}
+        self._names_blob = ""
+        self.name_offsets = array("I", [0])
+        self.by_name: List[int] = []
+        self.last_id = 0
+        # Последнее учтенное изменение из таблицы changes (см. sync)
+        self.last_seq = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def load(self, conn):
+        """Дозагружает строки с id больше последнего загруженного"""
+        with self._lock:
+            rows = conn.execute(
+                "SELECT id, name, category, price FROM products WHERE id > ? ORDER BY id",
+                (self.last_id,)
+            ).fetchall()
+            if not rows:
+                return 0
+
+            first = len(self.ids)
+            names = []
+            for product_id, name, category, price in rows:
+                code = self._category_index.get(category)
+                if code is None:
+                    code = len(self.categories)
+                    category = sys.intern(category)
+                    self.categories.append(category)
+                    self._category_index[category] = code
+
+                self.ids.append(product_id)
+                self.prices.append(price)
+                self.category_codes.append(code)
+                self.name_offsets.append(self.name_offsets[-1] + len(name))
+                names.append(name)
+
+            self._names_blob += "".join(names)
+            self.last_id = self.ids[-1]
+
+            if first == 0:
+                self.by_name = sorted(range(len(self.ids)), key=self.name)
+            else:
+                for index in range(first, len(self.ids)):
+                    self._insert_by_name(index)
+        return len(rows)
+
+    def sync(self, conn) -> bool:
+        """
+        Приводит снимок к состоянию БД, включая записи других процессов.
+        Новые изменения только вставки - дозагрузка новых строк; есть изменения
+        или удаления либо часть ленты уже удалена (prune) - снимок строится заново.
+        Возвращает True, если снимок перестроен
+        """
+        with self._lock:
+            # seq читается до строк: запись между чтениями попадет в следующий sync
+            oldest, latest = conn.execute("SELECT MIN(seq), MAX(seq) FROM changes").fetchone()
+            latest = latest or 0
+            if latest == self.last_seq and self.ids:
+                return False
+            rebuild = latest < self.last_seq or (oldest is not None and oldest > self.last_seq + 1)
+            if not rebuild and self.ids:
+                rebuild = conn.execute(
+                    "SELECT 1 FROM changes WHERE seq > ? AND seq <= ? AND op != 'insert' LIMIT 1",
+                    (self.last_seq, latest)
+                ).fetchone() is not None
+            if rebuild:
+                self._reset()
+            self.load(conn)
+            self.last_seq = latest
+            return rebuild
+
+    def _insert_by_name(self, index: int):
+        # bisect с key появился только в Python 3.10
+        name = self.name(index)
+        low, high = 0, len(self.by_name)
+        while low < high:
+            middle = (low + high) // 2
+            if self.name(self.by_name[middle]) <= name:
+                low = middle + 1
+            else:
+                high = middle
+        self.by_name.insert(low, index)
+
+    def name(self, index: int) -> str:
+        return self._names_blob[self.name_offsets[index]:self.name_offsets[index + 1]]
+
+    def row(self, index: int) -> Product:
+        return Product(
+            self.ids[index],
+            self.name(index),
+            self.categories[self.category_codes[index]],
+            self.prices[index],
+        )
+
+    def column(self, field: str):
+        """Функция чтения поля товара по индексу строки"""
+        if field == "id":
+            return self.ids.__getitem__
+        if field == "price":
+            return self.prices.__getitem__
+        if field == "category":
+            categories, codes = self.categories, self.category_codes
+            return lambda index: categories[codes[index]]
+        if field == "name":
+            return self.name
+        raise ValueError(f"Неизвестное поле товара: {field}")
+
+    def project(self, indexes, fields: Optional[Sequence[str]] = None, rows: bool = False) -> list:
+        """
+        Товары с индексами indexes: Product (все поля), словари полей fields
+        либо кортежи значений при rows=True
+        """
+        if fields is None and not rows:
+            return [self.row(i) for i in indexes]
+        fields = fields or ("id", "name", "category", "price")
+        getters = [self.column(field) for field in fields]
+        if rows:
+            return [tuple(get(i) for get in getters) for i in indexes]
+        return [{field: get(i) for field, get in zip(fields, getters)} for i in indexes]
+
+    def _category_codes_like(self, category: str) -> set:
+        matches = like_matcher(category)
+        return {code for code, value in enumerate(self.categories) if matches(value)}
+
+    def select(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        order_by: str = "id",
+        limit: Optional[int] = None,
+        category_equals: Optional[str] = None,
+        name: Optional[str] = None,
+        offset: int = 0,
+        fields: Optional[Sequence[str]] = None,
+        rows: bool = False
+    ) -> list:
+        """
+        Фильтрует снимок. Фильтр категории сравнивает коды (категорий мало),
+        фильтр цены читает массив prices без обращения к объектам товаров.
+        Каждый фильтр - проход на Python, строящий список индексов подходящих строк
+        """
+        with self._lock:
+            if order_by == "name":
+                indexes = self.by_name
+            else:
+                indexes = range(len(self.ids))
+
+            if category is not None or category_equals is not None:
+                if category_equals is not None:
+                    code = self._category_index.get(category_equals)
+                    codes = set() if code is None else {code}
+                else:
+                    codes = self._category_codes_like(category)
+                category_codes = self.category_codes
+                indexes = [i for i in indexes if category_codes[i] in codes]
+
+            if name is not None:
+                matches = like_matcher(name)
+                indexes = [i for i in indexes if matches(self.name(i))]
+
+            if min_price is not None or max_price is not None:
+                low = float("-inf") if min_price is None else min_price
+                high = float("inf") if max_price is None else max_price
+                prices = self.prices
+                indexes = [i for i in indexes if low <= prices[i] <= high]
+
+            end = None if limit is None else offset + limit
+            if order_by in ("price", "price_desc"):
+                # Индекс строки растет вместе с id, поэтому (цена, индекс) = ORDER BY price, id
+                prices = self.prices
+                key = lambda i: (prices[i], i)
+                if end is None:
+                    indexes = sorted(indexes, key=key, reverse=order_by == "price_desc")
+                elif order_by == "price":
+                    indexes = heapq.nsmallest(end, indexes, key=key)
+                else:
+                    indexes = heapq.nlargest(end, indexes, key=key)
+            indexes = indexes[offset:end]
+
+            return self.project(indexes, fields, rows)
+
+    def find_by_id(self, product_id: int, fields: Optional[Sequence[str]] = None):
+        """Поиск по id бинарным поиском (ids упорядочены по возрастанию)"""
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            index = bisect.bisect_left(self.ids, product_id)
+            if index < len(self.ids) and self.ids[index] == product_id:
+                return self.project((index,), fields)[0]
+            return None
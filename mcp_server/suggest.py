@@ -0,0 +1,97 @@
+"""
+Автодополнение названий товаров и категорий
+Отсортированный массив ключей с бинарным поиском по префиксу
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+# Максимальная длина ключа: для автодополнения хватает начала названия
+MAX_KEY_LENGTH = 64
+
+
+def normalize_key(text: str) -> str:
+    """Ключ для сравнения префиксов: нижний регистр, ё → е, одиночные пробелы"""
+    return " ".join(text.lower().replace("ё", "е").split())[:MAX_KEY_LENGTH]
+
+
+class PrefixIndex:
+    """
+    Индекс префиксов:
+    - keys: отсортированные пары (ключ, ID товара); для каждого слова названия
+      хранится ключ, начинающийся с этого слова ("зел" → "Чай зеленый")
+    - categories: отсортированные пары (ключ, категория)
+    """
+
+    def __init__(self):
+        self.keys: List[Tuple[str, int]] = []
+        self.categories: List[Tuple[str, str]] = []
+        self._known_categories = set()
+        # Последний загруженный ID по шардам каталога
+        self.last_ids: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def load(self, conn, shard: int = 0) -> int:
+        """Дозагружает товары шарда с id больше последнего загруженного"""
+        with self._lock:
+            rows = conn.execute(
+                "SELECT id, name, category FROM products WHERE id > ? ORDER BY id",
+                (self.last_ids.get(shard, 0),)
+            ).fetchall()
+            # Много строк (первая загрузка шарда) дописываются и сортируются разом:
+            # timsort сливает уже отсортированные ключи с новыми за линейное время
+            bulk = len(rows) > 1
+            for product_id, name, category in rows:
+                for key in self._name_keys(name):
+                    if bulk:
+                        self.keys.append((key, product_id))
+                    else:
+                        bisect.insort(self.keys, (key, product_id))
+                if category not in self._known_categories:
+                    self._known_categories.add(category)
+                    bisect.insort(self.categories, (normalize_key(category), category))
+                self.last_ids[shard] = product_id
+            if bulk:
+                self.keys.sort()
+        return len(rows)
+
+    @staticmethod
+    def _name_keys(name: str) -> List[str]:
+        words = normalize_key(name).split(" ")
+        return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+    @staticmethod
+    def _range(items: list, prefix: str) -> Tuple[int, int]:
+        start = bisect.bisect_left(items, (prefix,))
+        end = bisect.bisect_left(items, (prefix + "\uffff",))
+        return start, end
+
+    def suggest(self, prefix: str, limit: int = 10) -> Dict[str, list]:
+        """
+        Возвращает категории и ID товаров, у которых название
+        (или одно из слов названия) начинается с prefix
+        """
+        prefix = normalize_key(prefix)
+        if not prefix:
+            return {"categories": [], "product_ids": []}
+
+        with self._lock:
+            start, end = self._range(self.categories, prefix)
+            categories = [category for _, category in self.categories[start:min(end, start + limit)]]
+
+            # Ключи перебираются по индексу без копирования диапазона: для короткого
+            # префикса он охватывает большую часть индекса, а нужны первые limit товаров
+            keys = self.keys
+            start, end = self._range(keys, prefix)
+            product_ids = []
+            seen = set()
+            for index in range(start, end):
+                product_id = keys[index][1]
+                if product_id not in seen:
+                    seen.add(product_id)
+                    product_ids.append(product_id)
+                    if len(product_ids) >= limit:
+                        break
+
+        return {"categories": categories, "product_ids": product_ids}
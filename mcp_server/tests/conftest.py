@@ -0,0 +1,31 @@
+"""Общие фикстуры тестов MCP сервера"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """Модуль db с новой временной БД (тестовые товары) и сброшенным состоянием процесса"""
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "products.db"))
+    monkeypatch.setattr(db, "SHARDS", 1)
+    monkeypatch.setattr(db, "SHARD_BY", "id")
+    monkeypatch.setattr(db, "USE_SNAPSHOT", False)
+    monkeypatch.setattr(db, "SNAPSHOT_SYNC_INTERVAL", 1.0)
+    monkeypatch.setattr(db, "_initialized", False)
+    monkeypatch.setattr(db, "_snapshot", None)
+    monkeypatch.setattr(db, "_snapshot_synced", 0.0)
+    monkeypatch.setattr(db, "_fuzzy_index", None)
+    monkeypatch.setattr(db, "_prefix_index", None)
+    monkeypatch.setattr(db, "_writers", {})
+    monkeypatch.setattr(db, "_router", None)
+    monkeypatch.setattr(db, "_shard_pool", None)
+    monkeypatch.setattr(db, "_change_listeners", [])
+    monkeypatch.setattr(db, "_commits_since_prune", {})
+    return db
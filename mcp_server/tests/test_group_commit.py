@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pytest
+
+from group_commit import GroupCommitWriter
+
+
+@pytest.fixture
+def connect(tmp_path):
+    path = str(tmp_path / "products.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price REAL NOT NULL
+        )
+    """)
+    conn.close()
+    return lambda: sqlite3.connect(path, check_same_thread=False)
+
+
+def product_names(connect):
+    conn = connect()
+    names = [name for name, in conn.execute("SELECT name FROM products ORDER BY id")]
+    conn.close()
+    return names
+
+
+def test_commit_each_isolates_failed_row(connect):
+    writer = GroupCommitWriter(connect, lambda: None)
+    conn = connect()
+    batch = [
+        (("Чай", "Напитки", 100), Future()),
+        ((None, "Напитки", 50), Future()),
+        (("Кофе", "Напитки", 300), Future()),
+    ]
+    # Группа уже начата и частично записана, когда одна из вставок не прошла
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("INSERT INTO products (name, category, price) VALUES ('Чай', 'Напитки', 100)")
+    
+    results = writer._commit_each(conn, batch, sqlite3.IntegrityError("NOT NULL"))
+    
+    assert [product.name for product in (results[0], results[2])] == ["Чай", "Кофе"]
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert writer.metrics["failed_rows"] == 1
+    assert writer.metrics["commits"] == 2
+    assert product_names(connect) == ["Чай", "Кофе"]
+
+
+def test_commit_each_without_connection_fails_every_row():
+    writer = GroupCommitWriter(lambda: None, lambda: None)
+    error = sqlite3.OperationalError("unable to open database file")
+    batch = [(("Чай", "Напитки", 100), Future()), (("Кофе", "Напитки", 300), Future())]
+    assert writer._commit_each(None, batch, error) == [error, error]
+    assert writer.metrics["failed_rows"] == 2
+
+
+def test_failed_insert_does_not_affect_rest_of_group(connect):
+    commits = []
+    writer = GroupCommitWriter(connect, lambda: commits.append(1), max_batch=3, window=0.5)
+    start = threading.Barrier(3)
+    
+    def insert(values):
+        start.wait()
+        return writer.insert(*values)
+    
+    rows = [("Чай", "Напитки", 100), (None, "Напитки", 50), ("Кофе", "Напитки", 300)]
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(insert, values) for values in rows]
+    
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result()
+    assert {futures[0].result().name, futures[2].result().name} == {"Чай", "Кофе"}
+    assert sorted(product_names(connect)) == ["Кофе", "Чай"]
+    assert writer.metrics["failed_rows"] == 1
+    assert commits
+
+
+def test_after_write_notifies_listeners_when_refresh_and_prune_fail(catalog, monkeypatch):
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+    
+    monkeypatch.setattr(catalog, "refresh_snapshot", fail)
+    monkeypatch.setattr(catalog, "prune_changes", fail)
+    monkeypatch.setattr(catalog, "CHANGES_PRUNE_EVERY", 1)
+    notified = []
+    catalog.add_change_listener(lambda: notified.append(1))
+    
+    product = catalog.add_product("Новый товар", "Сладости", 10)
+    assert catalog.find_product_by_id(product.id).name == "Новый товар"
+    assert notified == [1]
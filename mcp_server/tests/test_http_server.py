@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import http_server  # noqa: E402
+
+
+@pytest.fixture
+def client(catalog):
+    return TestClient(http_server.app)
+
+
+def test_call_tool_keeps_next_cursor(client):
+    response = client.post("/tools/call", json={"name": "list_products", "arguments": {"limit": 10}})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert len(body["result"]) == 10
+    assert body["next_cursor"] == "10"
+    
+    response = client.post(
+        "/tools/call",
+        json={"name": "list_products", "arguments": {"limit": 10, "cursor": body["next_cursor"]}}
+    )
+    assert [product["id"] for product in response.json()["result"]] == list(range(11, 21))
+
+
+def test_mcp_websocket_answers_requests(client):
+    with client.websocket_connect("/mcp/ws") as websocket:
+        websocket.send_json([
+            {"jsonrpc": "2.0", "id": 1, "method": "tools/list", "params": {}},
+            {"jsonrpc": "2.0", "id": 2, "method": "tools/call",
+             "params": {"name": "find_product_by_ID", "arguments": {"id": 1}}},
+        ])
+        responses = {response["id"]: response for response in websocket.receive_json()}
+    assert {tool["name"] for tool in responses[1]["result"]["tools"]} >= {"list_products"}
+    assert responses[2]["result"]["isError"] is False
+    assert json.loads(responses[2]["result"]["content"][0]["text"])["result"]["id"] == 1
@@ -0,0 +1,129 @@
+import random
+
+import pytest
+
+import benchmark
+import shards
+from shards import MERGE_KEYS, SORT_COLUMNS, merge_sorted
+
+ORDERS = ["id", "name", "price", "price_desc"]
+
+
+def random_rows(count, seed=0):
+    rng = random.Random(seed)
+    # Повторяющиеся названия и цены: порядок при равенстве задает id
+    return [
+        (product_id, f"Товар {rng.randrange(20)}", "Овощи", float(rng.randrange(50)))
+        for product_id in range(1, count + 1)
+    ]
+
+
+def split_sorted(rows, order_by, shard_count, project=lambda row: row):
+    key = MERGE_KEYS[order_by]
+    reverse = order_by == "price_desc"
+    return [
+        [project(row) for row in sorted(rows[shard::shard_count], key=key, reverse=reverse)]
+        for shard in range(shard_count)
+    ]
+
+
+@pytest.mark.parametrize("order_by", ORDERS)
+@pytest.mark.parametrize("offset, limit", [(0, None), (0, 10), (37, 25), (290, 50), (400, 10)])
+def test_merge_sorted_matches_global_sort(order_by, offset, limit):
+    rows = random_rows(300)
+    expected = sorted(rows, key=MERGE_KEYS[order_by], reverse=order_by == "price_desc")
+    end = None if limit is None else offset + limit
+    merged = merge_sorted(split_sorted(rows, order_by, 3), order_by, limit, offset)
+    assert merged == expected[offset:end]
+
+
+@pytest.mark.parametrize("order_by", ORDERS)
+def test_merge_sorted_sort_keys(order_by):
+    # Кортежи столбцов SORT_COLUMNS сравниваются без функции-ключа
+    columns = [column.strip() for column in SORT_COLUMNS[order_by].split(",")]
+    index = {"id": shards.ID, "name": shards.NAME, "price": shards.PRICE}
+    project = lambda row: tuple(row[index[column]] for column in columns)
+    rows = random_rows(200, seed=1)
+    expected = [project(row) for row in sorted(rows, key=MERGE_KEYS[order_by], reverse=order_by == "price_desc")]
+    results = split_sorted(rows, order_by, 4, project)
+    assert merge_sorted(results, order_by, 20, 150, sort_keys=True) == expected[150:170]
+
+
+def test_merge_sorted_single_and_empty_shards():
+    rows = random_rows(10)
+    assert merge_sorted([rows, [], []], "id", 5, 2) == rows[2:7]
+    assert merge_sorted([[], []], "price", 5, 0) == []
+
+
+ROWS = 3000
+
+QUERIES = {
+    "list_products": lambda db, order_by, offset: db.get_all_products(
+        order_by=order_by, limit=50, offset=offset),
+    "find_product": lambda db, order_by, offset: db.find_product_by_name(
+        "1", order_by=order_by, limit=50, offset=offset),
+    "find_products_by_category": lambda db, order_by, offset: db.find_products_by_category(
+        "Овощи", order_by=order_by, limit=50, offset=offset),
+    "find_products_by_price_range": lambda db, order_by, offset: db.find_products_by_price_range(
+        100, 600, order_by=order_by, limit=50, offset=offset),
+    "compact": lambda db, order_by, offset: db.get_all_products(
+        order_by=order_by, limit=50, offset=offset, fields=["id", "price"], rows=True),
+}
+
+
+def query_results(db, shard_count):
+    path = benchmark.make_catalog(ROWS, shard_count)
+    try:
+        return {
+            (name, order_by, offset): query(db, order_by, offset)
+            for name, query in QUERIES.items()
+            for order_by in ORDERS
+            for offset in (0, 700, 2500)
+        }
+    finally:
+        benchmark.remove_catalog(path, shard_count)
+
+
+@pytest.mark.parametrize("shard_count", [2, 3])
+def test_sharded_deep_pages_match_unsharded(catalog, shard_count):
+    expected = query_results(catalog, 1)
+    sharded = query_results(catalog, shard_count)
+    for key, rows in expected.items():
+        assert sharded[key] == rows, key
+    # Дальние страницы действительно непустые
+    assert expected[("list_products", "price", 2500)]
+
+
+@pytest.fixture
+def sharded_catalog(catalog, tmp_path):
+    """Каталог из двух шардов в tmp_path"""
+    catalog.SHARDS = 2
+    catalog.init_db()
+    catalog._initialized = False
+    return catalog
+
+
+@pytest.mark.parametrize("shard_count", [1, 3])
+def test_changed_shard_count_is_refused(sharded_catalog, shard_count):
+    sharded_catalog.SHARDS = shard_count
+    with pytest.raises(ValueError, match="шард"):
+        sharded_catalog.init_db()
+
+
+def test_changed_shard_by_is_refused(sharded_catalog):
+    sharded_catalog.SHARD_BY = "category"
+    with pytest.raises(ValueError, match="PRODUCTS_SHARD_BY"):
+        sharded_catalog.init_db()
+
+
+def test_unsharded_catalog_is_not_ignored(catalog):
+    catalog.init_db()
+    catalog._initialized = False
+    catalog.SHARDS = 2
+    with pytest.raises(ValueError, match="PRODUCTS_SHARDS=2"):
+        catalog.init_db()
+
+
+def test_same_shard_settings_reopen(sharded_catalog):
+    sharded_catalog.init_db()
+    assert len(sharded_catalog.get_all_products()) == len(sharded_catalog.TEST_PRODUCTS)
@@ -0,0 +1,83 @@
+import sqlite3
+
+import pytest
+
+from snapshot import like_matcher
+
+
+def product_ids(products):
+    return [product.id for product in products]
+
+
+@pytest.mark.parametrize("pattern, value, expected", [
+    ("молоко", "Молоко 3.2%", False),
+    ("олоко", "Молоко 3.2%", True),
+    ("М_локо", "Молоко 3.2%", True),
+    ("М_локо", "Млоко", False),
+    ("%", "", True),
+    ("3.2%", "Молоко 3.2%", True),
+    ("3_2", "Молоко 3.2%", True),
+    ("3.2", "Молоко 3,2%", False),
+    ("MILK", "fresh milk", True),
+    ("a%c", "abbbc", True),
+    ("(", "a(b", True),
+])
+def test_like_matcher(pattern, value, expected):
+    assert like_matcher(pattern)(value) is expected
+    # Тот же ответ дает LIKE в SQLite
+    conn = sqlite3.connect(":memory:")
+    assert bool(conn.execute("SELECT ? LIKE ?", (value, f"%{pattern}%")).fetchone()[0]) is expected
+
+
+@pytest.mark.parametrize("pattern", ["М_локо", "%", "_", "Мол%о", "молоко", "ол", "%а_"])
+def test_snapshot_wildcards_match_sqlite(catalog, pattern):
+    expected_names = product_ids(catalog.find_product_by_name(pattern))
+    expected_categories = product_ids(catalog.find_products_by_category(pattern))
+    catalog.USE_SNAPSHOT = True
+    assert product_ids(catalog.find_product_by_name(pattern)) == expected_names
+    assert product_ids(catalog.find_products_by_category(pattern)) == expected_categories
+
+
+def test_snapshot_sees_writes_of_other_processes(catalog, monkeypatch):
+    catalog.USE_SNAPSHOT = True
+    monkeypatch.setattr(catalog, "SNAPSHOT_SYNC_INTERVAL", 0)
+    count = len(catalog.get_all_products())
+    
+    # Отдельное соединение - как запись другого процесса
+    conn = sqlite3.connect(catalog.DB_PATH)
+    new_id = conn.execute(
+        "INSERT INTO products (name, category, price) VALUES ('Новый товар', 'Сладости', 10)"
+    ).lastrowid
+    conn.commit()
+    assert len(catalog.get_all_products()) == count + 1
+    assert catalog.find_product_by_id(new_id).name == "Новый товар"
+    
+    conn.execute("UPDATE products SET price = 99 WHERE id = 1")
+    conn.execute("DELETE FROM products WHERE id = 2")
+    conn.commit()
+    conn.close()
+    assert catalog.find_product_by_id(1).price == 99
+    assert catalog.find_product_by_id(2) is None
+    assert len(catalog.get_all_products()) == count
+
+
+def test_snapshot_reads_between_syncs_skip_sqlite(catalog, monkeypatch):
+    catalog.USE_SNAPSHOT = True
+    count = len(catalog.get_all_products())
+    syncs = []
+    monkeypatch.setattr(catalog, "refresh_snapshot", lambda: syncs.append(1))
+    for _ in range(10):
+        assert len(catalog.get_all_products()) == count
+    assert syncs == []
+    
+    # Интервал истек - следующее чтение сверяет снимок с лентой изменений
+    monkeypatch.setattr(catalog, "_snapshot_synced", 0.0)
+    catalog.get_all_products()
+    assert syncs == [1]
+
+
+def test_snapshot_sees_own_writes_immediately(catalog):
+    catalog.USE_SNAPSHOT = True
+    catalog.get_all_products()
+    product = catalog.add_product("Новый товар", "Сладости", 10)
+    assert catalog.find_product_by_id(product.id).name == "Новый товар"
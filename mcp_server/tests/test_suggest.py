@@ -0,0 +1,25 @@
+import sqlite3
+
+from suggest import PrefixIndex
+
+
+def make_index(products):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, category TEXT)")
+    conn.executemany("INSERT INTO products (name, category) VALUES (?, ?)", products)
+    index = PrefixIndex()
+    index.load(conn)
+    return index
+
+
+def test_suggest_stops_at_limit():
+    index = make_index([(f"Чай {i}", "Напитки") for i in range(1000)] + [("Чайник", "Посуда")])
+    assert index.suggest("ча", limit=3)["product_ids"] == [1, 2, 11]
+    assert index.suggest("чайн")["product_ids"] == [1001]
+
+
+def test_suggest_matches_words_and_categories():
+    index = make_index([("Чай зеленый", "Напитки"), ("Зелень", "Овощи")])
+    assert index.suggest("зел") == {"categories": [], "product_ids": [1, 2]}
+    assert index.suggest("нап") == {"categories": ["Напитки"], "product_ids": []}
+    assert index.suggest("  ") == {"categories": [], "product_ids": []}
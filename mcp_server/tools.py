@@ -1,8 +1,11 @@
 import ast
+import logging
 import operator
 from typing import Any, Dict
 import db
 
+logger = logging.getLogger("tools")
+
 # Безопасные операции для калькулятора
 SAFE_OPERATORS = {
     ast.Add: operator.add,
@@ -53,6 +56,131 @@ def safe_eval(expression: str) -> float:
         raise ValueError(f"Ошибка вычисления: {str(e)}")
 
 
+def parse_listing_options(arguments: Dict[str, Any], default_order: str):
+    """Проверяет параметры сортировки и ограничения списка (order_by, limit)"""
+    order_by = arguments.get("order_by") or default_order
+    if order_by not in db.ORDER_BY:
+        raise ValueError(f"Параметр 'order_by' должен быть одним из: {', '.join(db.ORDER_BY)}")
+    
+    limit = arguments.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (ValueError, TypeError):
+            raise ValueError("Параметр 'limit' должен быть целым числом")
+        if limit <= 0:
+            raise ValueError("Параметр 'limit' должен быть больше нуля")
+    
+    return order_by, limit
+
+
+def parse_cursor(arguments: Dict[str, Any]) -> int:
+    """Читает курсор страницы (next_cursor из предыдущего ответа) и возвращает смещение"""
+    cursor = arguments.get("cursor")
+    if not cursor:
+        return 0
+    try:
+        offset = int(cursor)
+    except (ValueError, TypeError):
+        raise ValueError("Некорректный параметр 'cursor'")
+    if offset < 0:
+        raise ValueError("Некорректный параметр 'cursor'")
+    return offset
+
+
+def page_limit(limit):
+    """Запрашиваем на одну строку больше страницы, чтобы узнать, есть ли следующая"""
+    return None if limit is None else limit + 1
+
+
+def parse_projection(arguments: Dict[str, Any]):
+    """
+    Читает проекцию (fields) и формат ответа (format).
+    Возвращает (поля или None, compact): compact - ответ {"columns", "rows"}
+    """
+    fields = arguments.get("fields")
+    if fields is not None:
+        if not isinstance(fields, list) or not fields or any(field not in db.PRODUCT_FIELDS for field in fields):
+            raise ValueError(f"Параметр 'fields' должен быть списком из: {', '.join(db.PRODUCT_FIELDS)}")
+        fields = tuple(dict.fromkeys(fields))
+    
+    response_format = arguments.get("format") or "objects"
+    if response_format not in ("objects", "compact"):
+        raise ValueError("Параметр 'format' должен быть objects или compact")
+    return fields, response_format == "compact"
+
+
+def page_result(products: list, limit, offset: int, columns=None) -> Dict[str, Any]:
+    """
+    Формирует ответ со страницей товаров и курсором следующей страницы.
+    columns - имена полей, если products - кортежи (компактный формат)
+    """
+    result = {"success": True}
+    if limit is not None and len(products) > limit:
+        products = products[:limit]
+        result["next_cursor"] = str(offset + limit)
+    result["result"] = products if columns is None else {"columns": list(columns), "rows": products}
+    result["count"] = len(products)
+    return result
+
+
+def compact_columns(fields, compact: bool):
+    """Имена столбцов компактного ответа или None для списка объектов"""
+    if not compact:
+        return None
+    return fields or db.PRODUCT_FIELDS
+
+
+def parse_price(arguments: Dict[str, Any], key: str):
+    """Читает необязательную цену из аргументов"""
+    value = arguments.get(key)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        raise ValueError(f"Параметр '{key}' должен быть числом")
+
+
+# Общие параметры сортировки для инструментов со списками товаров
+LISTING_PROPERTIES = {
+    "order_by": {
+        "type": "string",
+        "enum": list(db.ORDER_BY),
+        "description": "Сортировка: id, name, price (сначала дешевые) или price_desc (сначала дорогие)"
+    },
+    "limit": {
+        "type": "integer",
+        "description": "Максимальное количество товаров в ответе (например, 10 самых дешевых); "
+                       "если товаров больше, ответ содержит next_cursor"
+    },
+    "cursor": {
+        "type": "string",
+        "description": "Курсор следующей страницы (next_cursor из предыдущего ответа)"
+    }
+}
+
+# Выбор возвращаемых полей товара
+FIELDS_PROPERTY = {
+    "fields": {
+        "type": "array",
+        "items": {"type": "string", "enum": list(db.PRODUCT_FIELDS)},
+        "description": "Возвращаемые поля товара (по умолчанию все)"
+    }
+}
+
+# Проекция и компактный формат для инструментов со списками товаров
+PROJECTION_PROPERTIES = {
+    **FIELDS_PROPERTY,
+    "format": {
+        "type": "string",
+        "enum": ["objects", "compact"],
+        "description": "objects - список объектов (по умолчанию), "
+                       "compact - {columns: [...], rows: [[...], ...]} без повторения имен полей"
+    }
+}
+
+
 # MCP инструменты
 MCP_TOOLS = [
     {
@@ -60,7 +188,10 @@ MCP_TOOLS = [
         "description": "Возвращает список всех товаров из базы данных",
         "inputSchema": {
             "type": "object",
-            "properties": {},
+            "properties": {
+                **LISTING_PROPERTIES,
+                **PROJECTION_PROPERTIES
+            },
             "required": []
         }
     },
@@ -73,11 +204,50 @@ MCP_TOOLS = [
                 "name": {
                     "type": "string",
                     "description": "Название товара для поиска"
-                }
+                },
+                **LISTING_PROPERTIES,
+                **PROJECTION_PROPERTIES
             },
             "required": ["name"]
         }
     },
+    {
+        "name": "fuzzy_find_product",
+        "description": "Нечеткий поиск товаров по имени, устойчивый к опечаткам (например, 'малако' найдет 'Молоко')",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "name": {
+                    "type": "string",
+                    "description": "Название товара для поиска (может содержать опечатки)"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Максимальное количество товаров в ответе (по умолчанию 10)"
+                },
+                **FIELDS_PROPERTY
+            },
+            "required": ["name"]
+        }
+    },
+    {
+        "name": "suggest_products",
+        "description": "Автодополнение: товары и категории, название которых (или слово в названии) начинается с указанного префикса",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "prefix": {
+                    "type": "string",
+                    "description": "Начало названия товара или категории"
+                },
+                "limit": {
+                    "type": "integer",
+                    "description": "Максимальное количество товаров и категорий в ответе (по умолчанию 10)"
+                }
+            },
+            "required": ["prefix"]
+        }
+    },
     {
         "name": "find_products_by_category",
         "description": "Ищет товары по категории",
@@ -87,11 +257,37 @@ MCP_TOOLS = [
                 "category": {
                     "type": "string",
                     "description": "Категория товаров для поиска"
-                }
+                },
+                **LISTING_PROPERTIES,
+                **PROJECTION_PROPERTIES
             },
             "required": ["category"]
         }
     },
+    {
+        "name": "find_products_by_price_range",
+        "description": "Ищет товары в диапазоне цен (границы включительно), можно ограничить точной категорией",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "min_price": {
+                    "type": "number",
+                    "description": "Минимальная цена"
+                },
+                "max_price": {
+                    "type": "number",
+                    "description": "Максимальная цена"
+                },
+                "category": {
+                    "type": "string",
+                    "description": "Точное название категории (например, 'Молочные продукты')"
+                },
+                **LISTING_PROPERTIES,
+                **PROJECTION_PROPERTIES
+            },
+            "required": []
+        }
+    },
     {
         "name": "find_product_by_ID",
         "description": "Ищет товар по ID",
@@ -101,7 +297,8 @@ MCP_TOOLS = [
                 "id": {
                     "type": "integer",
                     "description": "ID товара"
-                }
+                },
+                **FIELDS_PROPERTY
             },
             "required": ["id"]
         }
@@ -147,42 +344,101 @@ MCP_TOOLS = [
 
 def execute_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     """Выполняет MCP инструмент и возвращает результат"""
+    logger.debug("Вызов инструмента %s с аргументами %s", tool_name, arguments)
     try:
         if tool_name == "list_products":
-            products = db.get_all_products()
-            return {
-                "success": True,
-                "result": products,
-                "count": len(products)
-            }
+            try:
+                order_by, limit = parse_listing_options(arguments, "id")
+                offset = parse_cursor(arguments)
+                fields, compact = parse_projection(arguments)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            products = db.get_all_products(order_by, page_limit(limit), offset, fields, compact)
+            return page_result(products, limit, offset, compact_columns(fields, compact))
         
         elif tool_name == "find_product":
             name = arguments.get("name")
             if not name:
                 return {"success": False, "error": "Параметр 'name' обязателен"}
-            products = db.find_product_by_name(name)
+            try:
+                order_by, limit = parse_listing_options(arguments, "name")
+                offset = parse_cursor(arguments)
+                fields, compact = parse_projection(arguments)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            products = db.find_product_by_name(name, order_by, page_limit(limit), offset, fields, compact)
+            return page_result(products, limit, offset, compact_columns(fields, compact))
+        
+        elif tool_name == "fuzzy_find_product":
+            name = arguments.get("name")
+            if not name:
+                return {"success": False, "error": "Параметр 'name' обязателен"}
+            try:
+                _, limit = parse_listing_options(arguments, "id")
+                fields, _ = parse_projection(arguments)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            products = db.fuzzy_find_products(name, limit or 10, fields)
             return {
                 "success": True,
                 "result": products,
                 "count": len(products)
             }
         
+        elif tool_name == "suggest_products":
+            prefix = arguments.get("prefix")
+            if not prefix:
+                return {"success": False, "error": "Параметр 'prefix' обязателен"}
+            try:
+                _, limit = parse_listing_options(arguments, "id")
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            suggestions = db.suggest_products(prefix, limit or 10)
+            return {
+                "success": True,
+                "result": suggestions,
+                "count": len(suggestions["products"])
+            }
+        
         elif tool_name == "find_products_by_category":
             category = arguments.get("category")
             if not category:
                 return {"success": False, "error": "Параметр 'category' обязателен"}
-            products = db.find_products_by_category(category)
-            return {
-                "success": True,
-                "result": products,
-                "count": len(products)
-            }
+            try:
+                order_by, limit = parse_listing_options(arguments, "name")
+                offset = parse_cursor(arguments)
+                fields, compact = parse_projection(arguments)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            products = db.find_products_by_category(category, order_by, page_limit(limit), offset, fields, compact)
+            return page_result(products, limit, offset, compact_columns(fields, compact))
+        
+        elif tool_name == "find_products_by_price_range":
+            try:
+                min_price = parse_price(arguments, "min_price")
+                max_price = parse_price(arguments, "max_price")
+                order_by, limit = parse_listing_options(arguments, "price")
+                offset = parse_cursor(arguments)
+                fields, compact = parse_projection(arguments)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            if min_price is not None and max_price is not None and min_price > max_price:
+                return {"success": False, "error": "Параметр 'min_price' не может быть больше 'max_price'"}
+            products = db.find_products_by_price_range(
+                min_price, max_price, arguments.get("category") or None,
+                order_by, page_limit(limit), offset, fields, compact
+            )
+            return page_result(products, limit, offset, compact_columns(fields, compact))
         
         elif tool_name == "find_product_by_ID":
             product_id = arguments.get("id")
             if product_id is None:
                 return {"success": False, "error": "Параметр 'id' обязателен"}
-            product = db.find_product_by_id(product_id)
+            try:
+                fields, _ = parse_projection(arguments)
+            except ValueError as e:
+                return {"success": False, "error": str(e)}
+            product = db.find_product_by_id(product_id, fields)
             if product:
                 return {"success": True, "result": product}
             else:
@@ -229,5 +485,6 @@ def execute_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
             return {"success": False, "error": f"Неизвестный инструмент: {tool_name}"}
     
     except Exception as e:
+        logger.exception("Ошибка выполнения инструмента %s", tool_name)
         return {"success": False, "error": f"Ошибка выполнения инструмента: {str(e)}"}
 
@@ -5,98 +5,151 @@ Telegram бот для работы с базой данных товаров ч
 Версия на aiogram (совместима с Python 3.13)
 """
 
+import html
 import json
-import re
+import logging
+import secrets
+import threading
 from typing import Optional, Dict
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import (
+    Message, CallbackQuery, InlineQuery, InlineQueryResultArticle, InputTextMessageContent,
+    InlineKeyboardMarkup, InlineKeyboardButton
+)
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode, ChatAction
+from aiogram.exceptions import TelegramBadRequest
 import asyncio
 import requests
 import config
 from mcp_client import mcp_client
+from singleflight import SingleFlight
+from page_store import PageStore
+from send_scheduler import BULK, SendScheduler, SendSchedulerMiddleware, send_priority
+from log_setup import new_request_id, setup_logging
 
+logger = logging.getLogger("bot")
 
-# Промпт для LLM
-SYSTEM_PROMPT = """Ты — умный помощник для работы с базой данных товаров.
 
-Ты можешь использовать следующие инструменты:
+# Промпт для LLM. Описания инструментов передаются отдельно как tools
+# (function calling), поэтому в промпте только общие правила
+SYSTEM_PROMPT = """Ты — умный помощник для работы с базой данных товаров супермаркета.
 
-list_products - показать все товары
-find_product - найти товары по имени (требует параметр "name")
-find_products_by_category - найти товары по категории (требует параметр "category")
-find_product_by_ID - найти товар по ID
-add_product - добавить товар (требует параметры "name", "category", "price")
-calculate - вычислить математическое выражение (требует параметр "expression")
+Если для ответа нужны данные о товарах, вычисление или добавление товара, вызови подходящий инструмент. Если инструмент не нужен, просто ответь пользователю обычным текстом.
 
-Когда пользователь просит что-то сделать, определи, какой инструмент нужен, и верни JSON в формате:
+Категории в базе пишутся с заглавной буквы, например "Молочные продукты", "Фрукты". Для "N самых дешевых/дорогих" используй параметры limit и order_by.
 
-{
-"tool": "название_инструмента",
-"arguments": {"параметр": "значение"}
-}
+Отвечай на русском языке, будь дружелюбным и полезным."""
 
-Если инструмент не нужен, просто ответь пользователю обычным текстом.
+# Инструменты, которые не предлагаются LLM (служебные, для inline-режима)
+LLM_EXCLUDED_TOOLS = {"suggest_products"}
 
-Примеры:
+# Параметры инструментов для программных клиентов: бот форматирует полные объекты товаров
+LLM_EXCLUDED_PARAMETERS = {"fields", "format"}
 
-"покажи все товары" → {"tool": "list_products", "arguments": {}}
-"найди чай" → {"tool": "find_product", "arguments": {"name": "чай"}}
-"покажи товары в категории электроника" → {"tool": "find_products_by_category", "arguments": {"category": "Электроника"}}
-"найди все товары категории одежда" → {"tool": "find_products_by_category", "arguments": {"category": "Одежда"}}
-"добавь товар яблоки 120 фрукт" → {"tool": "add_product", "arguments": {"name": "яблоки", "category": "фрукт", "price": 120}}
-"сколько будет 2+2" → {"tool": "calculate", "arguments": {"expression": "2+2"}}
+# Описания инструментов для LLM (загружаются из GET /tools один раз)
+_llm_tools: Optional[list] = None
 
-Отвечай на русском языке, будь дружелюбным и полезным."""
 
+def llm_parameters(schema: dict) -> dict:
+    """Схема параметров инструмента без LLM_EXCLUDED_PARAMETERS"""
+    properties = schema.get("properties", {})
+    return {
+        **schema,
+        "properties": {
+            key: value for key, value in properties.items() if key not in LLM_EXCLUDED_PARAMETERS
+        }
+    }
 
-def parse_tool_call(response_text: str) -> Optional[Dict]:
-    """Парсит JSON из ответа LLM"""
-    print(f"[DEBUG] Парсинг ответа LLM: {response_text[:200]}...")
-    
-    # Сначала пробуем распарсить весь ответ как JSON
-    try:
-        parsed = json.loads(response_text.strip())
-        if isinstance(parsed, dict) and "tool" in parsed:
-            print(f"[DEBUG] Найден JSON инструмент: {parsed}")
-            return parsed
-    except json.JSONDecodeError:
-        pass
+
+def get_llm_tools() -> list:
+    """
+    Возвращает инструменты MCP сервера в формате function calling.
+    Список запрашивается один раз; при недоступности сервера - повторно при следующем вызове.
+    """
+    global _llm_tools
+    if _llm_tools is not None:
+        return _llm_tools
     
-    # Ищем JSON объект с "tool" в тексте (улучшенное регулярное выражение)
-    # Ищем от { до }, учитывая вложенные объекты
-    json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*"tool"[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-    json_match = re.search(json_pattern, response_text, re.DOTALL)
-    if json_match:
-        try:
-            parsed = json.loads(json_match.group())
-            if isinstance(parsed, dict) and "tool" in parsed:
-                print(f"[DEBUG] Найден JSON инструмент через regex: {parsed}")
-                return parsed
-        except json.JSONDecodeError as e:
-            print(f"[DEBUG] Ошибка парсинга JSON: {e}")
-            pass
+    result = mcp_client.list_tools()
+    if not result.get("success"):
+        logger.error("Не удалось получить список инструментов: %s", result.get("error"))
+        return []
     
-    # Пробуем найти JSON с помощью более простого подхода
-    # Ищем от первой { до последней }
-    start = response_text.find('{')
-    end = response_text.rfind('}')
-    if start != -1 and end != -1 and end > start:
+    _llm_tools = [
+        {
+            "type": "function",
+            "function": {
+                "name": tool["name"],
+                "description": tool.get("description", ""),
+                "parameters": llm_parameters(tool.get("inputSchema", {"type": "object", "properties": {}}))
+            }
+        }
+        for tool in result["tools"]
+        if tool["name"] not in LLM_EXCLUDED_TOOLS
+    ]
+    return _llm_tools
+
+
+def parse_tool_call(llm_message: dict) -> Optional[Dict]:
+    """Возвращает первый вызов инструмента из ответа LLM (поле tool_calls)"""
+    for tool_call in llm_message.get("tool_calls") or []:
+        function = tool_call.get("function") or {}
+        if not function.get("name"):
+            continue
         try:
-            json_str = response_text[start:end+1]
-            parsed = json.loads(json_str)
-            if isinstance(parsed, dict) and "tool" in parsed:
-                print(f"[DEBUG] Найден JSON инструмент через поиск скобок: {parsed}")
-                return parsed
+            arguments = json.loads(function.get("arguments") or "{}")
         except json.JSONDecodeError:
-            pass
-    
-    print(f"[DEBUG] JSON инструмент не найден в ответе")
+            logger.warning("Некорректные аргументы инструмента %s: %s", function["name"], function.get("arguments"))
+            continue
+        return {"tool": function["name"], "arguments": arguments if isinstance(arguments, dict) else {}}
     return None
 
 
+# Максимальная длина сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Инструменты со списками товаров, поддерживающие постраничный вывод (limit + cursor)
+PAGED_TOOLS = {"list_products", "find_product", "find_products_by_category", "find_products_by_price_range"}
+
+# Товаров на одной странице
+PAGE_SIZE = 10
+
+# Сколько последних списков помнить для кнопок листания
+PAGE_STATES_LIMIT = 1000
+
+# Состояния списков: токен → инструмент, аргументы и курсоры уже открытых страниц.
+# Общие для всех процессов webhook-режима (SQLite)
+page_store = PageStore(config.PAGE_STATE_DB, PAGE_STATES_LIMIT)
+
+
+def format_product_lines(product: dict) -> str:
+    """Форматирует товар для списка"""
+    return (
+        f"🆔 ID: {product['id']}\n"
+        f"📝 Название: {html.escape(product['name'])}\n"
+        f"🏷️ Категория: {html.escape(product['category'])}\n"
+        f"💰 Цена: {product['price']:.2f} ₽\n"
+        + "─" * 30 + "\n"
+    )
+
+
+def join_within_limit(header: str, blocks: list, footer: str = "") -> str:
+    """Склеивает блоки, пока сообщение помещается в лимит Telegram"""
+    parts = [header]
+    length = len(header) + len(footer)
+    for block in blocks:
+        if length + len(block) > TELEGRAM_MESSAGE_LIMIT:
+            break
+        parts.append(block)
+        length += len(block)
+    parts.append(footer)
+    return "".join(parts)
+
+
 def format_products_response(products: list, count: int = None) -> str:
     """Форматирует список товаров для красивого отображения"""
     if not products:
@@ -108,53 +161,132 @@ def format_products_response(products: list, count: int = None) -> str:
     # Ограничиваем количество товаров для отображения (чтобы не было слишком длинно)
     display_products = products[:20]
     
-    result = f"📦 Найдено товаров: {count}\n\n"
-    
-    for product in display_products:
-        result += f"🆔 ID: {product['id']}\n"
-        result += f"📝 Название: {product['name']}\n"
-        result += f"🏷️ Категория: {product['category']}\n"
-        result += f"💰 Цена: {product['price']:.2f} ₽\n"
-        result += "─" * 30 + "\n"
-    
-    if count > 20:
-        result += f"\n... и еще {count - 20} товаров"
-    
-    return result
+    footer = f"\n... и еще {count - 20} товаров" if count > 20 else ""
+    return join_within_limit(
+        f"📦 Найдено товаров: {count}\n\n",
+        [format_product_lines(product) for product in display_products],
+        footer
+    )
+
+
+def format_products_page(products: list, page: int) -> str:
+    """Форматирует страницу списка товаров"""
+    if not products:
+        return "Товары не найдены."
+    return join_within_limit(
+        f"📦 Товары, страница {page + 1}\n\n",
+        [format_product_lines(product) for product in products]
+    )
+
+
+async def save_page_state(tool_name: str, arguments: dict, next_cursor: Optional[str]) -> str:
+    """Запоминает список для кнопок листания и возвращает его токен"""
+    token = secrets.token_urlsafe(8)
+    cursors = [None, next_cursor] if next_cursor else [None]
+    await asyncio.to_thread(page_store.save, token, tool_name, arguments, cursors)
+    return token
+
+
+def page_keyboard(token: str, page: int, has_next: bool) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки «назад» / «вперед» для страницы списка"""
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"page:{token}:{page - 1}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="Вперед ▶️", callback_data=f"page:{token}:{page + 1}"))
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
 
 
 def format_single_product(product: dict) -> str:
-    """Форматирует один товар для отображения"""
+    """Форматирует один товар для отображения (HTML: название и категория экранируются)"""
     return f"""📦 Товар найден!
 
 🆔 ID: {product['id']}
-📝 Название: {product['name']}
-🏷️ Категория: {product['category']}
+📝 Название: {html.escape(product['name'])}
+🏷️ Категория: {html.escape(product['category'])}
 💰 Цена: {product['price']:.2f} ₽"""
 
 
-async def get_llm_response(user_message: str) -> str:
-    """Получает ответ от LLM"""
+# Одинаковые одновременные запросы к LLM и MCP выполняются один раз
+llm_flight = SingleFlight("llm")
+tool_flight = SingleFlight("mcp")
+
+# Инструменты с побочными эффектами: одинаковые вызовы нельзя объединять
+NON_COALESCED_TOOLS = {"add_product"}
+
+# Процессов, отправляющих сообщения от имени бота: общий лимит делится между ними
+SEND_PROCESSES = max(1, config.WEBHOOK_PROCESSES) if config.BOT_MODE == "webhook" else 1
+
+# Исходящие сообщения с учетом ограничений частоты Telegram
+send_scheduler = SendScheduler(
+    global_rate=config.SEND_GLOBAL_RATE / SEND_PROCESSES,
+    chat_rate=config.SEND_CHAT_RATE,
+    group_rate=config.SEND_GROUP_RATE / 60,
+    max_retries=config.SEND_MAX_RETRIES
+)
+
+
+def normalize_message(text: str) -> str:
+    """Ключ для объединения сообщений: нижний регистр, одиночные пробелы"""
+    return " ".join(text.lower().split())
+
+
+async def get_llm_response(user_message: str) -> dict:
+    """
+    Получает ответ от LLM.
+    Одновременные одинаковые (после нормализации) сообщения разделяют один запрос.
+    """
+    return await llm_flight.do(
+        normalize_message(user_message),
+        lambda: asyncio.to_thread(request_llm_response, user_message)
+    )
+
+
+async def call_mcp_tool(tool_name: str, arguments: dict, timeout: float = 10) -> dict:
+    """
+    Вызывает MCP инструмент, не блокируя цикл событий.
+    Одновременные вызовы с одинаковыми (tool, arguments) разделяют один запрос.
+    """
+    if tool_name in NON_COALESCED_TOOLS:
+        return await asyncio.to_thread(mcp_client.call_tool, tool_name, arguments, timeout)
+    key = (tool_name, json.dumps(arguments, ensure_ascii=False, sort_keys=True))
+    return await tool_flight.do(
+        key,
+        lambda: asyncio.to_thread(mcp_client.call_tool, tool_name, arguments, timeout)
+    )
+
+
+def build_llm_request(user_message: str) -> tuple:
+    """Заголовки и тело запроса к chat-completions"""
+    # Используем OpenAI через Proxyapi
+    headers = {
+        "Authorization": f"Bearer {config.OPENAI_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    
+    payload = {
+        "model": config.OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_message}
+        ]
+    }
+    tools = get_llm_tools()
+    if tools:
+        payload["tools"] = tools
+    return headers, payload
+
+
+def request_llm_response(user_message: str) -> dict:
+    """
+    Синхронный запрос к LLM (выполняется в отдельном потоке).
+    Возвращает сообщение ассистента: content и, если LLM вызвал инструмент, tool_calls.
+    """
     try:
-        print(f"[DEBUG] Отправка запроса в LLM: {user_message[:50]}...")
-        print(f"[DEBUG] Используется Proxyapi URL: {config.PROXYAPI_URL}")
-        print(f"[DEBUG] Модель: {config.OPENAI_MODEL}")
-        
-        # Используем OpenAI через Proxyapi
-        headers = {
-            "Authorization": f"Bearer {config.OPENAI_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": config.OPENAI_MODEL,
-            "messages": [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_message}
-            ]
-        }
-        
-        print(f"[DEBUG] Payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+        logger.debug("Запрос в LLM (%s): %.50s", config.OPENAI_MODEL, user_message)
+        headers, payload = build_llm_request(user_message)
         
         response = requests.post(
             f"{config.PROXYAPI_URL}/chat/completions",
@@ -165,29 +297,220 @@ async def get_llm_response(user_message: str) -> str:
         
         # Детальное логирование ошибок
         if response.status_code != 200:
-            error_detail = response.text
-            print(f"[ERROR] HTTP {response.status_code}: {error_detail}")
-            try:
-                error_json = response.json()
-                print(f"[ERROR] Детали ошибки: {json.dumps(error_json, ensure_ascii=False, indent=2)}")
-            except:
-                pass
+            logger.error("LLM вернул HTTP %s: %s", response.status_code, response.text)
             response.raise_for_status()
         
         result = response.json()
-        llm_answer = result["choices"][0]["message"]["content"].strip()
-        print(f"[DEBUG] Получен ответ от LLM: {llm_answer[:100]}...")
-        return llm_answer
+        llm_message = result["choices"][0]["message"]
+        logger.debug("Получен ответ от LLM: %.100s", llm_message)
+        return llm_message
     except requests.exceptions.HTTPError as e:
         error_msg = f"Ошибка HTTP при обращении к LLM: {str(e)}"
-        if hasattr(e.response, 'text'):
-            print(f"[ERROR] Ответ сервера: {e.response.text}")
-        print(f"[ERROR] {error_msg}")
-        return error_msg
+        logger.error(error_msg)
+        return {"content": error_msg}
     except Exception as e:
         error_msg = f"Ошибка при обращении к LLM: {str(e)}"
-        print(f"[ERROR] {error_msg}")
-        return error_msg
+        logger.exception("Ошибка при обращении к LLM")
+        return {"content": error_msg}
+
+
+def request_llm_stream(user_message: str, emit, stop: Optional[threading.Event] = None) -> None:
+    """
+    Синхронный потоковый запрос к LLM (SSE, выполняется в отдельном потоке).
+    Установленный stop прекращает чтение ответа и закрывает соединение.
+    Передает в emit события:
+    - ("content", фрагмент текста)
+    - ("tool_call", {"tool": ..., "arguments": ...}) - как только аргументы первого
+      вызова инструмента полностью получены, не дожидаясь конца ответа
+    - ("error", текст ошибки)
+    - ("done", None)
+    """
+    tool_name = None
+    tool_arguments = ""
+    try:
+        logger.debug("Потоковый запрос в LLM (%s): %.50s", config.OPENAI_MODEL, user_message)
+        headers, payload = build_llm_request(user_message)
+        payload["stream"] = True
+        
+        with requests.post(
+            f"{config.PROXYAPI_URL}/chat/completions",
+            headers=headers,
+            json=payload,
+            timeout=30,
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                logger.error("LLM вернул HTTP %s: %s", response.status_code, response.text)
+                response.raise_for_status()
+            
+            for line in response.iter_lines(decode_unicode=True):
+                if stop is not None and stop.is_set():
+                    logger.debug("Потоковый ответ LLM больше не нужен: соединение закрывается")
+                    return
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                
+                chunk = json.loads(data)
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta") or {}
+                
+                if delta.get("content"):
+                    emit(("content", delta["content"]))
+                
+                for tool_delta in delta.get("tool_calls") or []:
+                    # Используем только первый вызов инструмента, как и без потоковой передачи
+                    if tool_delta.get("index", 0) != 0:
+                        continue
+                    function = tool_delta.get("function") or {}
+                    tool_name = tool_name or function.get("name")
+                    tool_arguments += function.get("arguments") or ""
+                
+                # Аргументы выглядят законченными - запускаем инструмент, не дожидаясь конца потока
+                if tool_name and tool_arguments.rstrip().endswith("}"):
+                    try:
+                        arguments = json.loads(tool_arguments)
+                    except json.JSONDecodeError:
+                        continue
+                    emit(("tool_call", {"tool": tool_name, "arguments": arguments}))
+                    return
+        
+        if tool_name:
+            tool_call = parse_tool_call({"tool_calls": [
+                {"function": {"name": tool_name, "arguments": tool_arguments}}
+            ]})
+            if tool_call:
+                emit(("tool_call", tool_call))
+                return
+    except Exception as e:
+        error_msg = f"Ошибка при обращении к LLM: {str(e)}"
+        logger.exception("Ошибка потокового запроса к LLM")
+        emit(("error", error_msg))
+    finally:
+        emit(("done", None))
+
+
+async def stream_llm_events(user_message: str):
+    """
+    Асинхронный итератор событий request_llm_stream.
+    Потребитель должен закрыть итератор (aclose), в том числе при ошибке:
+    тогда поток перестает читать ответ LLM и итератор дожидается его завершения
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    
+    def emit(event):
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+    
+    task = asyncio.ensure_future(asyncio.to_thread(request_llm_stream, user_message, emit, stop))
+    try:
+        while True:
+            kind, value = await queue.get()
+            if kind == "done":
+                break
+            yield kind, value
+            if kind == "tool_call":
+                break
+    finally:
+        # После tool_call, ошибки или раннего выхода потребителя поток выходит
+        # на следующей строке ответа; его исключения не теряются
+        stop.set()
+        await task
+
+
+async def edit_streamed_message(sent: Message, text: str) -> bool:
+    """Редактирует сообщение с частичным ответом; ошибки правки не прерывают поток"""
+    try:
+        await sent.edit_text(html.escape(text[:TELEGRAM_MESSAGE_LIMIT]))
+        return True
+    except Exception as e:
+        logger.warning("Ошибка при обновлении сообщения: %s", e)
+        return False
+
+
+async def stream_llm_message(message: Message, user_message: str) -> dict:
+    """
+    Получает ответ LLM потоком. Текстовый ответ сразу отправляется пользователю
+    и дописывается правками сообщения не чаще STREAM_EDIT_INTERVAL секунд.
+    Возвращает итог в виде ответа LLM (content и tool_calls), как get_llm_response
+    """
+    loop = asyncio.get_running_loop()
+    sent = None
+    text = ""
+    last_edit = 0.0
+    
+    events = stream_llm_events(user_message)
+    try:
+        async for kind, value in events:
+            if kind == "tool_call":
+                if sent is not None:
+                    # Текст перед вызовом инструмента остается без значка набора,
+                    # заготовка без текста удаляется: результат инструмента придет отдельным сообщением
+                    if text.strip():
+                        await edit_streamed_message(sent, text.strip())
+                    else:
+                        try:
+                            await sent.delete()
+                        except Exception as e:
+                            logger.warning("Ошибка при удалении сообщения: %s", e)
+                return {
+                    "content": text,
+                    "tool_calls": [{"function": {
+                        "name": value["tool"],
+                        "arguments": json.dumps(value["arguments"], ensure_ascii=False)
+                    }}]
+                }
+            if kind == "error":
+                text = f"{text}\n\n{value}" if text else value
+                break
+            
+            text += value
+            now = loop.time()
+            if sent is None:
+                # Первый фрагмент - отправляем сообщение-заготовку
+                sent = await message.answer(html.escape(text) + " ✍️")
+                last_edit = now
+            elif now - last_edit >= config.STREAM_EDIT_INTERVAL:
+                # Промежуточная правка уступает очередь ответам другим пользователям
+                with send_priority(BULK):
+                    await edit_streamed_message(sent, text + " ✍️")
+                last_edit = now
+    finally:
+        # Ранний выход (tool_call, ошибка отправки сообщения) останавливает чтение потока
+        await events.aclose()
+    
+    final_text = text.strip() or "Не удалось получить ответ. Попробуйте еще раз."
+    if sent is None:
+        await message.answer(html.escape(final_text[:TELEGRAM_MESSAGE_LIMIT]))
+    else:
+        # Финальная правка убирает значок набора текста
+        await edit_streamed_message(sent, final_text)
+    logger.debug("Потоковый ответ отправлен пользователю")
+    return {"content": final_text}
+
+
+async def stream_llm_answer(message: Message, user_message: str) -> Optional[Dict]:
+    """
+    Отвечает на сообщение потоком LLM (stream_llm_message).
+    Если LLM вызвал инструмент, возвращает вызов, и результат инструмента отправляет вызывающий.
+    Одинаковые одновременные сообщения разделяют один запрос (llm_flight): поток получает
+    только первый отправитель, остальные ждут итог и получают текст одним сообщением
+    """
+    key = normalize_message(user_message)
+    if llm_flight.running(key):
+        llm_message = await get_llm_response(user_message)
+        tool_call = parse_tool_call(llm_message)
+        if tool_call is None:
+            text = (llm_message.get("content") or "").strip() or "Не удалось получить ответ. Попробуйте еще раз."
+            await message.answer(html.escape(text[:TELEGRAM_MESSAGE_LIMIT]))
+        return tool_call
+    
+    llm_message = await llm_flight.do(key, lambda: stream_llm_message(message, user_message))
+    return parse_tool_call(llm_message)
 
 
 async def handle_message(message: Message, bot: Bot):
@@ -198,33 +521,60 @@ async def handle_message(message: Message, bot: Bot):
     if user_message and user_message.startswith("/"):
         return
     
-    print(f"[DEBUG] Получено сообщение от пользователя: {user_message}")
+    logger.debug("Получено сообщение от пользователя: %s", user_message)
     
     # Показываем, что бот печатает
     await bot.send_chat_action(chat_id=message.chat.id, action=ChatAction.TYPING)
     
-    # Получаем ответ от LLM
-    llm_response = await get_llm_response(user_message)
-    
-    # Пытаемся найти вызов инструмента в ответе
-    tool_call = parse_tool_call(llm_response)
-    print(f"[DEBUG] Результат парсинга tool_call: {tool_call}")
+    if config.LLM_STREAMING:
+        # Текстовый ответ отправляется по мере генерации, сюда возвращается только вызов инструмента
+        tool_call = await stream_llm_answer(message, user_message)
+        if tool_call is None:
+            return
+        llm_message = {}
+    else:
+        # Получаем ответ от LLM
+        llm_message = await get_llm_response(user_message)
+        
+        # Проверяем, вызвал ли LLM инструмент
+        tool_call = parse_tool_call(llm_message)
+    logger.debug("Вызов инструмента от LLM: %s", tool_call)
     
+    reply_markup = None
     if tool_call and "tool" in tool_call:
-        print(f"[DEBUG] Вызываем инструмент: {tool_call['tool']} с аргументами: {tool_call.get('arguments')}")
+        logger.info("Вызов инструмента %s с аргументами %s", tool_call["tool"], tool_call.get("arguments"))
         # Нужно вызвать инструмент
         tool_name = tool_call["tool"]
         tool_args = tool_call.get("arguments", {})
         
+        # Списки без явного limit запрашиваем постранично, остальное - по кнопкам
+        paged = tool_name in PAGED_TOOLS and "limit" not in tool_args
+        if paged:
+            tool_args = {**tool_args, "limit": PAGE_SIZE}
+            tool_args.pop("cursor", None)
+        
         # Вызываем MCP инструмент
-        result = mcp_client.call_tool(tool_name, tool_args)
+        result = await call_mcp_tool(tool_name, tool_args)
+        
+        # Точный поиск ничего не нашел - сразу пробуем нечеткий, без повторного запроса к LLM
+        if tool_name == "find_product" and result.get("success") and not result.get("result"):
+            fuzzy_result = await call_mcp_tool("fuzzy_find_product", tool_args)
+            if fuzzy_result.get("success") and fuzzy_result.get("result"):
+                tool_name, result = "fuzzy_find_product", fuzzy_result
         
         if result.get("success"):
             # Форматируем результат в зависимости от инструмента
-            if tool_name == "list_products":
+            if paged and tool_name in PAGED_TOOLS:
+                products = result.get("result", [])
+                next_cursor = result.get("next_cursor")
+                response_text = format_products_page(products, 0)
+                if next_cursor:
+                    token = await save_page_state(tool_name, tool_args, next_cursor)
+                    reply_markup = page_keyboard(token, 0, True)
+            elif tool_name == "list_products":
                 products = result.get("result", [])
                 response_text = format_products_response(products, result.get("count"))
-            elif tool_name in ["find_product", "find_products_by_category"]:
+            elif tool_name in ["find_product", "fuzzy_find_product", "find_products_by_category", "find_products_by_price_range"]:
                 products = result.get("result", [])
                 response_text = format_products_response(products, result.get("count"))
             elif tool_name == "find_product_by_ID":
@@ -250,17 +600,118 @@ async def handle_message(message: Message, bot: Bot):
             response_text = f"❌ Ошибка: {error_msg}"
     else:
         # LLM ответил обычным текстом
-        response_text = llm_response
+        response_text = (llm_message.get("content") or "").strip() or "Не удалось получить ответ. Попробуйте еще раз."
     
     # Отправляем ответ пользователю
     try:
-        await message.answer(response_text)
-        print(f"[DEBUG] Ответ отправлен пользователю")
-    except Exception as e:
-        print(f"[ERROR] Ошибка при отправке ответа: {str(e)}")
+        await message.answer(response_text, reply_markup=reply_markup)
+        logger.debug("Ответ отправлен пользователю")
+    except Exception:
+        logger.exception("Ошибка при отправке ответа")
         await message.answer(f"Произошла ошибка при обработке запроса. Попробуйте еще раз.")
 
 
+async def handle_page_callback(callback: CallbackQuery):
+    """
+    Обработчик кнопок листания: запрашивает у MCP сервера только нужную страницу
+    по сохраненному курсору и редактирует сообщение на месте
+    """
+    try:
+        _, token, page = callback.data.split(":")
+        page = int(page)
+    except ValueError:
+        await callback.answer()
+        return
+    
+    state = await asyncio.to_thread(page_store.get, token)
+    if state is None or page < 0 or page >= len(state["cursors"]):
+        await callback.answer("Список устарел, повторите запрос", show_alert=True)
+        return
+    
+    arguments = dict(state["arguments"])
+    cursor = state["cursors"][page]
+    if cursor:
+        arguments["cursor"] = cursor
+    
+    result = await call_mcp_tool(state["tool"], arguments)
+    if not result.get("success"):
+        await callback.answer(f"❌ Ошибка: {result.get('error', 'Неизвестная ошибка')}", show_alert=True)
+        return
+    
+    next_cursor = result.get("next_cursor")
+    if next_cursor and len(state["cursors"]) == page + 1:
+        await asyncio.to_thread(page_store.add_cursor, token, page, next_cursor)
+    
+    # Сообщение старше 48 часов недоступно боту (InaccessibleMessage) и не редактируется
+    if not isinstance(callback.message, Message):
+        await callback.answer("Список устарел, повторите запрос", show_alert=True)
+        return
+    try:
+        await callback.message.edit_text(
+            format_products_page(result.get("result", []), page),
+            reply_markup=page_keyboard(token, page, bool(next_cursor))
+        )
+    except TelegramBadRequest as e:
+        # Повторное нажатие той же кнопки: "message is not modified"
+        logger.debug("Страница списка не обновлена: %s", e)
+    # Ответ на callback обязателен: иначе у пользователя не пропадает индикатор загрузки
+    await callback.answer()
+
+
+# Минимальная длина inline-запроса, с которой показываем подсказки
+INLINE_MIN_QUERY_LENGTH = 2
+
+# Сколько подсказок показывать в inline-режиме
+INLINE_RESULTS_LIMIT = 20
+
+
+def build_inline_results(suggestions: dict) -> list:
+    """Преобразует ответ suggest_products в результаты inline-запроса"""
+    results = []
+    for category in suggestions.get("categories", []):
+        results.append(InlineQueryResultArticle(
+            id=f"c{len(results)}",
+            title=f"🏷️ {category}",
+            description="Категория",
+            input_message_content=InputTextMessageContent(
+                message_text=f"покажи товары в категории {html.escape(category)}"
+            )
+        ))
+    for product in suggestions.get("products", []):
+        results.append(InlineQueryResultArticle(
+            id=f"p{product['id']}",
+            title=product["name"],
+            description=f"{product['category']} · {product['price']:.2f} ₽",
+            input_message_content=InputTextMessageContent(
+                message_text=format_single_product(product)
+            )
+        ))
+    return results[:INLINE_RESULTS_LIMIT]
+
+
+async def handle_inline_query(inline_query: InlineQuery):
+    """
+    Обработчик inline-запросов (@bot текст): подсказки по мере ввода.
+    Отвечает напрямую из suggest_products без обращения к LLM.
+    """
+    query = inline_query.query.strip()
+    if len(query) < INLINE_MIN_QUERY_LENGTH:
+        await inline_query.answer([], cache_time=300)
+        return
+    
+    # Запрос выполняется в отдельном потоке, чтобы не блокировать обработку
+    # остальных обновлений при вводе по буквам
+    result = await call_mcp_tool(
+        "suggest_products",
+        {"prefix": query, "limit": INLINE_RESULTS_LIMIT},
+        config.INLINE_QUERY_TIMEOUT
+    )
+    
+    results = build_inline_results(result.get("result") or {}) if result.get("success") else []
+    # Подсказки одинаковы для всех пользователей - Telegram может кешировать их глобально
+    await inline_query.answer(results, cache_time=30, is_personal=False)
+
+
 async def start_command(message: Message):
     """Обработчик команды /start"""
     welcome_message = """👋 Привет! Я бот-помощник для работы с базой данных товаров.
@@ -268,6 +719,7 @@ async def start_command(message: Message):
 Я могу помочь тебе:
 • 📋 Показать все товары
 • 🔍 Найти товары по имени или категории
+• ⌨️ Подсказывать товары прямо при вводе: напиши @имя_бота и начало названия
 • ➕ Добавить новый товар
 • 🧮 Выполнить математические вычисления
 
@@ -290,6 +742,7 @@ async def help_command(message: Message):
 Доступные команды:
 /start - Начать работу с ботом
 /help - Показать эту справку
+/stats - Статистика объединения запросов и отправки сообщений
 
 Примеры запросов:
 • "покажи все товары" - показать все товары в базе
@@ -304,33 +757,93 @@ async def help_command(message: Message):
     await message.answer(help_message)
 
 
-async def main():
-    """Запуск бота"""
-    print("Запуск Telegram бота (aiogram)...")
-    print(f"[CONFIG] Proxyapi URL: {config.PROXYAPI_URL}")
-    print(f"[CONFIG] OpenAI Model: {config.OPENAI_MODEL}")
-    print(f"[CONFIG] MCP Server URL: {config.MCP_SERVER_URL}")
-    print(f"[CONFIG] OpenAI API Key установлен: {'Да' if config.OPENAI_API_KEY else 'Нет'}")
-    if config.OPENAI_API_KEY:
-        print(f"[CONFIG] OpenAI API Key (первые 10 символов): {config.OPENAI_API_KEY[:10]}...")
+async def stats_command(message: Message):
+    """Обработчик команды /stats - сколько запросов сэкономило объединение, очередь отправки"""
+    lines = ["📊 Объединение одинаковых запросов\n"]
+    for flight in (llm_flight, tool_flight):
+        stats = flight.stats()
+        lines.append(
+            f"{flight.name}: вызовов {stats['calls']}, "
+            f"сэкономлено {stats['coalesced']}, выполняется {stats['inflight']}"
+        )
     
-    # Создаем бота и диспетчер
+    send = send_scheduler.stats()
+    lines.append(
+        f"\n📤 Отправка: отправлено {send['sent']}, в очереди {send['queued']}, "
+        f"повторов после 429 {send['retry_after']}, задержка p95 {send['latency_ms_p95']} мс"
+    )
+    await message.answer("\n".join(lines))
+
+
+def create_bot() -> Bot:
+    """Создает бота (с альтернативным Bot API сервером, если задан TELEGRAM_API_URL)"""
+    session = None
+    if config.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
     bot = Bot(
         token=config.TELEGRAM_API_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    if config.SEND_SCHEDULER:
+        bot.session.middleware(SendSchedulerMiddleware(send_scheduler))
+    return bot
+
+
+async def request_id_middleware(handler, event, data):
+    """Назначает каждому обновлению свой ID для записей в логах бота и MCP сервера"""
+    new_request_id()
+    return await handler(event, data)
+
+
+def create_dispatcher() -> Dispatcher:
+    """Создает диспетчер и регистрирует обработчики"""
     dp = Dispatcher()
+    dp.update.outer_middleware(request_id_middleware)
     
     # Регистрируем обработчики (команды должны быть зарегистрированы первыми)
     dp.message.register(start_command, Command("start"))
     dp.message.register(help_command, Command("help"))
+    dp.message.register(stats_command, Command("stats"))
     # Обработчик обычных сообщений (должен быть последним, чтобы не перехватывать команды)
     dp.message.register(handle_message, F.text)
+    # Кнопки листания списков товаров
+    dp.callback_query.register(handle_page_callback, F.data.startswith("page:"))
+    # Inline-режим (включается у @BotFather командой /setinline)
+    dp.inline_query.register(handle_inline_query)
+    return dp
+
+
+def print_config():
+    """Выводит текущую конфигурацию при запуске"""
+    logger.info("Режим: %s", config.BOT_MODE)
+    logger.info("Proxyapi URL: %s", config.PROXYAPI_URL)
+    logger.info("OpenAI Model: %s", config.OPENAI_MODEL)
+    logger.info("MCP Server URL: %s", config.MCP_SERVER_URL)
+    logger.info("OpenAI API Key установлен: %s", "Да" if config.OPENAI_API_KEY else "Нет")
+    logger.info("Уровень логирования: %s (доля DEBUG: %s)", config.LOG_LEVEL, config.LOG_DEBUG_SAMPLE_RATE)
+
+
+async def main():
+    """Запуск бота в режиме long polling"""
+    logger.info("Запуск Telegram бота (aiogram)...")
+    print_config()
+    
+    # Создаем бота и диспетчер
+    bot = create_bot()
+    dp = create_dispatcher()
     
     # Запускаем бота
-    print("Бот запущен и готов к работе!")
+    logger.info("Бот запущен и готов к работе!")
     await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    setup_logging(config.LOG_LEVEL, config.LOG_DEBUG_SAMPLE_RATE)
+    if config.BOT_MODE == "webhook":
+        import webhook
+        logger.info("Запуск Telegram бота (aiogram, webhook)...")
+        print_config()
+        webhook.run(create_bot, create_dispatcher, send_scheduler.stats)
+    else:
+        asyncio.run(main())
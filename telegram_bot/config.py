@@ -24,6 +24,64 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "o4-mini-2025-04-16")
 # Proxyapi URL (если используется)
 PROXYAPI_URL = os.getenv("PROXYAPI_URL", "https://api.proxyapi.ru/openai/v1")
 
+# Потоковая передача ответа LLM (SSE) с постепенным обновлением сообщения
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1") == "1"
+
+# Минимальный интервал между правками сообщения при потоковом ответе (секунды):
+# Telegram ограничивает частоту правок одного чата
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Таймаут запроса автодополнения для inline-режима (секунды):
+# Telegram ждет ответ на inline-запрос недолго, а пользователь печатает дальше
+INLINE_QUERY_TIMEOUT = float(os.getenv("INLINE_QUERY_TIMEOUT", "1.5"))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Альтернативный Bot API сервер (локальный Bot API или заглушка для нагрузочных тестов)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Webhook: публичный адрес, на который Telegram отправляет обновления
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
+# Webhook: адрес и порт, на которых слушает бот
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Webhook: число процессов на одном порту (SO_REUSEPORT, только Linux/BSD)
+WEBHOOK_PROCESSES = int(os.getenv("WEBHOOK_PROCESSES", "1"))
+
+# Файл SQLite с состояниями кнопок листания: общий для всех процессов webhook-режима
+PAGE_STATE_DB = os.getenv("PAGE_STATE_DB", "page_states.db")
+
+# Webhook: сколько обновлений обрабатывается одновременно в процессе и размер очереди
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+
+# Webhook: максимальное число одновременных соединений от Telegram (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# Планировщик исходящих сообщений с учетом ограничений частоты Telegram
+SEND_SCHEDULER = os.getenv("SEND_SCHEDULER", "1") == "1"
+
+# Сколько сообщений в секунду бот отправляет всего (во всех процессах webhook-режима вместе),
+# в один личный чат и сколько в минуту в одну группу (ограничения Telegram: ~30/с, ~1/с, 20/мин)
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", "20"))
+
+# Сколько раз повторять отправку после ответа 429 (retry_after)
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Уровень логирования (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Доля DEBUG-записей, попадающих в лог (0.0-1.0): при LOG_LEVEL=DEBUG под нагрузкой
+# можно оставить, например, каждую десятую
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
 # Проверка обязательных переменных
 if not TELEGRAM_API_TOKEN:
     raise ValueError("TELEGRAM_API_TOKEN не установлен в .env файле")
@@ -31,3 +89,8 @@ if not TELEGRAM_API_TOKEN:
 if not OPENAI_API_KEY:
     raise ValueError("OPENAI_API_KEY не установлен в .env файле")
 
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError("BOT_MODE должен быть polling или webhook")
+
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("WEBHOOK_URL не установлен в .env файле (обязателен для BOT_MODE=webhook)")
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест webhook-режима бота
+Поднимает заглушку Telegram Bot API, LLM (chat/completions) и MCP HTTP сервера,
+запускает бота в режиме webhook против нее и отправляет синтетические обновления.
+Запуск: python loadtest.py [--updates 1000] [--concurrency 50] [--processes 2] [--scenario tool]
+                          [--chats 100] [--flood-chat-limit 1] [--flood-global-limit 30]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from collections import deque
+
+from aiohttp import ClientSession, web
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class FakeAPI:
+    """
+    Заглушка Bot API, LLM и MCP: отвечает на любые методы бота успехом,
+    запоминает время отправки сообщений по chat_id.
+    Как Telegram, отвечает 429 с retry_after, если за последнюю секунду в чат отправлено
+    больше chat_limit сообщений или всего больше global_limit (0 - без ограничения).
+    В сценарии tool LLM вызывает инструмент calculate через tool_calls.
+    """
+
+    def __init__(self, llm_delay: float, scenario: str, chat_limit: int = 0, global_limit: int = 0):
+        self.llm_delay = llm_delay
+        self.scenario = scenario
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.sent_at = {}
+        self.messages = 0
+        self.flood_errors = 0
+        self._chat_sends = {}
+        self._global_sends = deque()
+        self.calls = 0
+        self.llm_requests = 0
+        self.llm_request_bytes = 0
+        self.tool_calls = 0
+        self._message_id = 0
+
+    async def handle_bot_method(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        method = request.match_info["method"].lower()
+        data = dict(await request.post()) if request.body_exists else {}
+
+        if method == "getme":
+            return web.json_response({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"
+            }})
+        if method in ("sendmessage", "editmessagetext"):
+            chat_id = int(data.get("chat_id", 0))
+            if self.flooded(chat_id):
+                self.flood_errors += 1
+                return web.json_response({
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1}
+                }, status=429)
+            if method == "sendmessage":
+                self.messages += 1
+            self.sent_at.setdefault(chat_id, time.perf_counter())
+            self._message_id += 1
+            return web.json_response({"ok": True, "result": {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", "")
+            }})
+        return web.json_response({"ok": True, "result": True})
+
+    def flooded(self, chat_id: int) -> bool:
+        """Учитывает отправку; True - превышен лимит чата или общий лимит за последнюю секунду"""
+        now = time.perf_counter()
+        chat_sends = self._chat_sends.setdefault(chat_id, deque())
+        for sends in (chat_sends, self._global_sends):
+            while sends and sends[0] <= now - 1:
+                sends.popleft()
+        if (self.chat_limit and len(chat_sends) >= self.chat_limit) or \
+                (self.global_limit and len(self._global_sends) >= self.global_limit):
+            return True
+        chat_sends.append(now)
+        self._global_sends.append(now)
+        return False
+
+    async def handle_chat_completions(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        self.llm_requests += 1
+        self.llm_request_bytes += len(body)
+        payload = json.loads(body)
+        if self.llm_delay:
+            await asyncio.sleep(self.llm_delay)
+
+        if self.scenario == "tool" and payload.get("tools"):
+            text = payload["messages"][-1]["content"]
+            arguments = json.dumps({"expression": text.split()[-1] + "+1"})
+            if payload.get("stream"):
+                # Аргументы приходят в двух фрагментах, как у настоящего API
+                middle = len(arguments) // 2
+                deltas = [
+                    {"tool_calls": [{"index": 0, "id": "call_1", "type": "function",
+                                     "function": {"name": "calculate", "arguments": arguments[:middle]}}]},
+                    {"tool_calls": [{"index": 0, "function": {"arguments": arguments[middle:]}}]},
+                ]
+                return await self.stream(request, deltas)
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": "call_1",
+                    "type": "function",
+                    "function": {"name": "calculate", "arguments": arguments}
+                }]
+            }
+            return web.json_response({"choices": [{"message": message, "finish_reason": "tool_calls"}]})
+
+        content = "Привет! Чем могу помочь?"
+        if payload.get("stream"):
+            return await self.stream(request, [{"content": word + " "} for word in content.split()])
+        return web.json_response({"choices": [{
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }]})
+
+    async def stream(self, request: web.Request, deltas: list) -> web.StreamResponse:
+        """Отдает фрагменты ответа в формате SSE, как chat-completions со stream=true"""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for delta in deltas:
+            chunk = {"choices": [{"index": 0, "delta": delta}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def handle_mcp_tools(self, request: web.Request) -> web.Response:
+        return web.json_response({"tools": [{
+            "name": "calculate",
+            "description": "Безопасный калькулятор",
+            "inputSchema": {
+                "type": "object",
+                "properties": {"expression": {"type": "string"}},
+                "required": ["expression"]
+            }
+        }]})
+
+    async def handle_mcp_call(self, request: web.Request) -> web.Response:
+        self.tool_calls += 1
+        call = await request.json()
+        expression = call["arguments"].get("expression", "")
+        return web.json_response({"success": True, "result": 0, "expression": expression})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_bot_method)
+        app.router.add_post("/v1/chat/completions", self.handle_chat_completions)
+        app.router.add_get("/mcp/tools", self.handle_mcp_tools)
+        app.router.add_post("/mcp/tools/call", self.handle_mcp_call)
+        return app
+
+
+def make_update(index: int, text: str, chats: int = 0) -> dict:
+    """Обновление с сообщением; при chats > 0 сообщения идут по кругу из chats чатов"""
+    chat_id = 100000 + (index % chats if chats else index)
+    return {
+        "update_id": index,
+        "message": {
+            "message_id": index,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": f"{text} {index}" if text != "/start" else text
+        }
+    }
+
+
+def stop_bot(bot: subprocess.Popen, timeout: float = 15):
+    """Останавливает бота вместе с его процессами webhook (SIGTERM всей группе)"""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(bot.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    else:
+        bot.terminate()
+    try:
+        bot.wait(timeout)
+    except subprocess.TimeoutExpired:
+        if hasattr(os, "killpg"):
+            os.killpg(bot.pid, signal.SIGKILL)
+        else:
+            bot.kill()
+        bot.wait()
+
+
+async def wait_for_bot(session: ClientSession, url: str, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Бот не запустился")
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(args):
+    fake = FakeAPI(args.llm_delay, args.scenario, args.flood_chat_limit, args.flood_global_limit)
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.api_port).start()
+
+    api_url = f"http://127.0.0.1:{args.api_port}"
+    env = {
+        **os.environ,
+        "BOT_MODE": "webhook",
+        "TELEGRAM_API_TOKEN": "123456:fake",
+        "OPENAI_API_KEY": "fake",
+        "TELEGRAM_API_URL": api_url,
+        "PROXYAPI_URL": f"{api_url}/v1",
+        "MCP_SERVER_URL": f"{api_url}/mcp",
+        "WEBHOOK_URL": f"http://127.0.0.1:{args.webhook_port}",
+        "WEBHOOK_HOST": "127.0.0.1",
+        "WEBHOOK_PORT": str(args.webhook_port),
+        "WEBHOOK_SECRET": "",
+        "WEBHOOK_PROCESSES": str(args.processes),
+        "UPDATE_CONCURRENCY": str(args.workers),
+        "LLM_STREAMING": "0" if args.no_streaming else "1",
+        "SEND_SCHEDULER": "0" if args.no_scheduler else "1",
+    }
+    # Своя группа процессов: остановка завершает и процессы webhook, запущенные ботом
+    bot = subprocess.Popen(
+        [sys.executable, "bot.py"], cwd=BOT_DIR, env=env,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+        start_new_session=hasattr(os, "killpg")
+    )
+
+    webhook_url = f"http://127.0.0.1:{args.webhook_port}/webhook"
+    accepted = []
+    started_at = {}
+    try:
+        async with ClientSession() as session:
+            await wait_for_bot(session, f"http://127.0.0.1:{args.webhook_port}/healthz")
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def post(index: int):
+                async with semaphore:
+                    update = make_update(index, args.text, args.chats)
+                    start = time.perf_counter()
+                    started_at.setdefault(update["message"]["chat"]["id"], start)
+                    async with session.post(webhook_url, json=update) as response:
+                        await response.read()
+                    accepted.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(post(index) for index in range(1, args.updates + 1)))
+            posted = time.perf_counter() - start
+
+            deadline = time.perf_counter() + args.timeout
+            while fake.messages < args.updates and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+            total = time.perf_counter() - start
+    finally:
+        stop_bot(bot)
+        await runner.cleanup()
+
+    latencies = [fake.sent_at[chat_id] - started for chat_id, started in started_at.items()
+                 if chat_id in fake.sent_at]
+    print(f"Обновлений: {args.updates}, процессов: {args.processes}, воркеров: {args.workers}")
+    print(f"  прием webhook: {posted:.2f} с, медиана {statistics.median(accepted) * 1000:.1f} мс, "
+          f"p95 {percentile(accepted, 0.95) * 1000:.1f} мс")
+    print(f"  ответов получено: {fake.messages} за {total:.2f} с "
+          f"({fake.messages / total:.0f} в секунду)")
+    if fake.chat_limit or fake.global_limit:
+        print(f"  ответов 429 (retry_after) от заглушки Bot API: {fake.flood_errors}")
+    if fake.llm_requests:
+        print(f"  запросов к LLM: {fake.llm_requests}, "
+              f"средний размер {fake.llm_request_bytes / fake.llm_requests:.0f} байт, "
+              f"вызовов инструментов: {fake.tool_calls}")
+    if latencies:
+        print(f"  до первого ответа в чат: медиана {statistics.median(latencies) * 1000:.1f} мс, "
+              f"p95 {percentile(latencies, 0.95) * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook-режима бота")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных POST от «Telegram»")
+    parser.add_argument("--processes", type=int, default=1, help="WEBHOOK_PROCESSES бота")
+    parser.add_argument("--workers", type=int, default=16, help="UPDATE_CONCURRENCY бота")
+    parser.add_argument("--text", default="привет", help="Текст сообщений (/start - без LLM)")
+    parser.add_argument("--scenario", choices=["text", "tool"], default="text",
+                        help="text - LLM отвечает текстом, tool - вызывает инструмент calculate")
+    parser.add_argument("--llm-delay", type=float, default=0.2, help="Задержка заглушки LLM, с")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8080)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--no-streaming", action="store_true", help="LLM_STREAMING=0 для бота")
+    parser.add_argument("--chats", type=int, default=0,
+                        help="Сообщения по кругу из стольких чатов (0 - у каждого сообщения свой чат)")
+    parser.add_argument("--flood-chat-limit", type=int, default=0,
+                        help="Заглушка отвечает 429 после стольких сообщений в чат за секунду (0 - без лимита)")
+    parser.add_argument("--flood-global-limit", type=int, default=0,
+                        help="Заглушка отвечает 429 после стольких сообщений всего за секунду (0 - без лимита)")
+    parser.add_argument("--no-scheduler", action="store_true", help="SEND_SCHEDULER=0 для бота")
+    parser.add_argument("--verbose", action="store_true", help="Показывать вывод бота")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
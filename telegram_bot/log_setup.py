@@ -0,0 +1,93 @@
+"""
+Настройка логирования бота
+Записи попадают в очередь и выводятся отдельным потоком (QueueListener),
+поэтому обработчики сообщений не ждут вывода в консоль.
+Каждая запись содержит ID запроса, который передается MCP серверу в X-Request-ID.
+Похожий модуль есть в mcp_server/log_setup.py: сервер и бот разворачиваются и запускаются
+отдельно (свой каталог и requirements.txt) и не импортируют код друг друга.
+"""
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import uuid
+
+# Значение ID вне обработки запроса (запуск, фоновые задачи)
+NO_REQUEST_ID = "-"
+
+# ID текущего запроса (обновления Telegram); наследуется задачами и asyncio.to_thread
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default=NO_REQUEST_ID)
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+_listener = None
+# Процесс, в котором запущен _listener: после fork поток вывода нужно запустить заново
+_listener_pid = None
+
+
+def new_request_id() -> str:
+    """Создает новый ID запроса и делает его текущим"""
+    request_id = uuid.uuid4().hex[:12]
+    request_id_var.set(request_id)
+    return request_id
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет в запись ID текущего запроса"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DebugSampler(logging.Filter):
+    """Пропускает только долю DEBUG-записей; записи уровня INFO и выше проходят всегда"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """
+    Кладет в очередь саму запись. Стандартный prepare() форматирует сообщение
+    и traceback в вызывающем потоке; здесь это делает поток вывода (QueueListener)
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = "INFO", debug_sample_rate: float = 1.0):
+    """
+    Настраивает корневой логгер: запись в очередь в вызывающем потоке, вывод в фоновом.
+    Повторный вызов в том же процессе ничего не делает.
+    """
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+
+    log_queue = queue.SimpleQueue()
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    handler = RecordQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    if debug_sample_rate < 1.0:
+        handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(_listener.stop)
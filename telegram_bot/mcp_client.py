@@ -2,9 +2,11 @@
 Клиент для работы с MCP сервером через HTTP
 """
 
+import json
 import requests
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, Optional, Union
 import config
+from log_setup import NO_REQUEST_ID, request_id_var
 
 
 class MCPClient:
@@ -12,14 +14,24 @@ class MCPClient:
     
     def __init__(self, base_url: str = None):
         self.base_url = base_url or config.MCP_SERVER_URL
+        # Переиспользуем TCP-соединения между вызовами (важно для автодополнения)
+        self.session = requests.Session()
     
-    def call_tool(self, tool_name: str, arguments: Dict[str, Any] = None) -> Dict[str, Any]:
+    @staticmethod
+    def _headers() -> Dict[str, str]:
+        """ID текущего запроса передается серверу, чтобы связать записи в логах бота и сервера"""
+        request_id = request_id_var.get()
+        return {"X-Request-ID": request_id} if request_id != NO_REQUEST_ID else {}
+    
+    def call_tool(self, tool_name: str, arguments: Dict[str, Any] = None,
+                  timeout: float = 10) -> Dict[str, Any]:
         """
         Вызывает MCP инструмент
         
         Args:
             tool_name: Название инструмента
             arguments: Аргументы для инструмента
+            timeout: Таймаут запроса в секундах
             
         Returns:
             Результат выполнения инструмента
@@ -34,7 +46,7 @@ class MCPClient:
         }
         
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = self.session.post(url, json=payload, timeout=timeout, headers=self._headers())
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -43,6 +55,18 @@ class MCPClient:
                 "error": f"Ошибка подключения к MCP серверу: {str(e)}"
             }
     
+    def list_tools(self) -> Dict[str, Any]:
+        """Получить список инструментов MCP сервера (GET /tools)"""
+        try:
+            response = self.session.get(f"{self.base_url}/tools", timeout=10, headers=self._headers())
+            response.raise_for_status()
+            return {"success": True, "tools": response.json()["tools"]}
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            return {
+                "success": False,
+                "error": f"Ошибка подключения к MCP серверу: {str(e)}"
+            }
+    
     def list_products(self) -> Dict[str, Any]:
         """Получить список всех товаров"""
         return self.call_tool("list_products", {})
@@ -51,10 +75,34 @@ class MCPClient:
         """Найти товары по имени"""
         return self.call_tool("find_product", {"name": name})
     
+    def fuzzy_find_product(self, name: str, limit: int = 10) -> Dict[str, Any]:
+        """Найти товары по имени с учетом опечаток"""
+        return self.call_tool("fuzzy_find_product", {"name": name, "limit": limit})
+    
+    def suggest_products(self, prefix: str, limit: int = 10,
+                         timeout: float = 10) -> Dict[str, Any]:
+        """Автодополнение товаров и категорий по префиксу"""
+        return self.call_tool("suggest_products", {"prefix": prefix, "limit": limit}, timeout=timeout)
+    
     def find_products_by_category(self, category: str) -> Dict[str, Any]:
         """Найти товары по категории"""
         return self.call_tool("find_products_by_category", {"category": category})
     
+    def find_products_by_price_range(self, min_price: float = None, max_price: float = None,
+                                     category: str = None, order_by: str = None,
+                                     limit: int = None) -> Dict[str, Any]:
+        """Найти товары в диапазоне цен"""
+        arguments = {
+            "min_price": min_price,
+            "max_price": max_price,
+            "category": category,
+            "order_by": order_by,
+            "limit": limit
+        }
+        return self.call_tool("find_products_by_price_range", {
+            key: value for key, value in arguments.items() if value is not None
+        })
+    
     def find_product_by_id(self, product_id: int) -> Dict[str, Any]:
         """Найти товар по ID"""
         return self.call_tool("find_product_by_ID", {"id": product_id})
@@ -70,6 +118,27 @@ class MCPClient:
     def calculate(self, expression: str) -> Dict[str, Any]:
         """Вычислить математическое выражение"""
         return self.call_tool("calculate", {"expression": expression})
+    
+    def watch_changes(self, since: Optional[Union[int, str]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Читает ленту изменений каталога (GET /changes, Server-Sent Events).
+        Возвращает события {"event": "sync" | "reset" | "change", "data": {...}};
+        номер последнего изменения (data["seq"], у шардированного каталога - data["cursor"])
+        передается в since при переподключении.
+        Блокирующий итератор: используйте в отдельном потоке.
+        """
+        params = {"since": since} if since is not None else None
+        # Таймаут чтения больше интервала keepalive сервера
+        with self.session.get(f"{self.base_url}/changes", params=params, stream=True,
+                              timeout=(10, 60), headers=self._headers()) as response:
+            response.raise_for_status()
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:") and event:
+                    yield {"event": event, "data": json.loads(line[len("data:"):])}
+                    event = None
 
 
 # Глобальный экземпляр клиента
@@ -0,0 +1,92 @@
+"""
+Состояния списков для кнопок листания
+Хранятся в SQLite, поэтому общие для всех процессов webhook-режима:
+кнопку может обработать любой процесс, а не только тот, что отправил список
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class PageStore:
+    """
+    Токен списка → инструмент, аргументы и курсоры уже открытых страниц.
+    Хранится не больше limit последних использованных списков.
+    Методы блокирующие: из асинхронного кода вызываются через asyncio.to_thread
+    """
+
+    def __init__(self, path: str, limit: int = 1000):
+        self.path = path
+        self.limit = limit
+        # Соединение открывается при первом обращении - уже в процессе-воркере
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_states (
+                    token TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    arguments TEXT NOT NULL,
+                    cursors TEXT NOT NULL,
+                    used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_page_states_used ON page_states (used)")
+            self._conn = conn
+        return self._conn
+
+    def save(self, token: str, tool: str, arguments: Dict[str, Any], cursors: list):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO page_states VALUES (?, ?, ?, ?, ?)",
+                (token, tool, json.dumps(arguments, ensure_ascii=False), json.dumps(cursors), time.time())
+            )
+            conn.execute(
+                """
+                DELETE FROM page_states WHERE token IN (
+                    SELECT token FROM page_states ORDER BY used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.limit,)
+            )
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Состояние списка (None, если он вытеснен или неизвестен); отмечает список использованным"""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT tool, arguments, cursors FROM page_states WHERE token = ?", (token,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE page_states SET used = ? WHERE token = ?", (time.time(), token))
+        return {"tool": row[0], "arguments": json.loads(row[1]), "cursors": json.loads(row[2])}
+
+    def add_cursor(self, token: str, page: int, cursor: str):
+        """Запоминает курсор страницы page + 1, если он еще неизвестен"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT cursors FROM page_states WHERE token = ?", (token,)).fetchone()
+                if row is not None:
+                    cursors = json.loads(row[0])
+                    if len(cursors) == page + 1:
+                        cursors.append(cursor)
+                        conn.execute(
+                            "UPDATE page_states SET cursors = ? WHERE token = ?", (json.dumps(cursors), token)
+                        )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
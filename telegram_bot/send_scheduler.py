@@ -0,0 +1,249 @@
+"""
+Планировщик исходящих сообщений Telegram
+Отправки ждут своей очереди по корзинам токенов - на каждый чат и на весь бот, -
+чтобы не упираться в ограничения частоты Telegram (flood limits).
+Ответ 429 с retry_after приостанавливает чат на указанное время и повторяет отправку.
+Ответы пользователям (INTERACTIVE) проходят раньше фоновой отправки (BULK).
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage, EditMessageReplyMarkup, EditMessageText, ForwardMessage,
+    SendDocument, SendMessage, SendPhoto
+)
+
+logger = logging.getLogger("send_scheduler")
+
+# Приоритеты: меньше - раньше
+INTERACTIVE = 0
+BULK = 1
+
+# Методы Bot API, на которые распространяются ограничения частоты сообщений.
+# Ответы на callback и inline-запросы, sendChatAction и прочие методы не планируются
+SCHEDULED_METHODS = (
+    SendMessage, EditMessageText, EditMessageReplyMarkup,
+    SendPhoto, SendDocument, CopyMessage, ForwardMessage
+)
+
+# Приоритет отправок текущей задачи (см. send_priority)
+send_priority_var: contextvars.ContextVar = contextvars.ContextVar("send_priority", default=INTERACTIVE)
+
+# Сколько последних отправок учитывается в перцентилях задержки
+LATENCY_SAMPLES = 1000
+
+# Больше стольких корзин чатов - полные корзины без ожидающих удаляются
+CHAT_BUCKETS_LIMIT = 10000
+
+
+@contextlib.contextmanager
+def send_priority(priority: int):
+    """Отправки внутри блока получают приоритет priority"""
+    token = send_priority_var.set(priority)
+    try:
+        yield
+    finally:
+        send_priority_var.reset(token)
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        # До этого момента отправка запрещена (retry_after от Telegram)
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        # После block() updated может быть в будущем: до него токены не копятся
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Момент, когда в корзине будет токен"""
+        self._refill(now)
+        at = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(at, self.blocked_until)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, until: float):
+        """Запрещает отправку до until; после паузы корзина начинает с пустой"""
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = 0
+        self.updated = max(self.updated, until)
+
+    def idle(self, now: float) -> bool:
+        """Корзина полна и не заблокирована - ее можно удалить и создать заново"""
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+class SendScheduler:
+    """
+    Очередь исходящих отправок.
+    Каждая отправка ждет токен в корзине своего чата и в общей корзине бота.
+    Ожидающие просматриваются в порядке (приоритет, время постановки): отправка в чат,
+    исчерпавший лимит, не задерживает отправки в другие чаты, а внутри чата
+    порядок сохраняется. Группы (chat_id < 0) ограничиваются отдельной частотой.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, group_rate: float = 20 / 60,
+                 max_retries: int = 3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global: Optional[TokenBucket] = None
+        self._chats: Dict[Any, TokenBucket] = {}
+        # Ожидающие: (приоритет, номер, chat_id, future)
+        self._waiting: list = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "sent": 0,
+            "retry_after": 0,
+            "failed": 0,
+            "max_queued": 0,
+        }
+        self._wait_ms: deque = deque(maxlen=LATENCY_SAMPLES)
+        self._latency_ms: deque = deque(maxlen=LATENCY_SAMPLES)
+
+    async def send(self, make_request, bot, method, chat_id):
+        """Выполняет запрос make_request(bot, method) в очередь чата chat_id"""
+        loop = asyncio.get_running_loop()
+        priority = send_priority_var.get()
+        enqueued = loop.time()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, priority)
+            if attempt == 0:
+                self._wait_ms.append((loop.time() - enqueued) * 1000)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.metrics["retry_after"] += 1
+                if attempt == self.max_retries:
+                    self.metrics["failed"] += 1
+                    raise
+                logger.warning("Telegram ограничил отправку в чат %s: повтор через %s с", chat_id, e.retry_after)
+                self._chat_bucket(chat_id, loop.time()).block(loop.time() + e.retry_after)
+                continue
+            except Exception:
+                self.metrics["failed"] += 1
+                raise
+            self.metrics["sent"] += 1
+            self._latency_ms.append((loop.time() - enqueued) * 1000)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики: глубина очереди по приоритетам, отправлено, повторы после 429, задержки"""
+        queued = [entry for entry in self._waiting if not entry[3].done()]
+        wait_ms = list(self._wait_ms)
+        latency_ms = list(self._latency_ms)
+        return {
+            **self.metrics,
+            "queued": len(queued),
+            "queued_interactive": sum(1 for entry in queued if entry[0] == INTERACTIVE),
+            "queued_bulk": sum(1 for entry in queued if entry[0] == BULK),
+            "wait_ms_p50": round(percentile(wait_ms, 0.5), 1),
+            "wait_ms_p95": round(percentile(wait_ms, 0.95), 1),
+            "latency_ms_p50": round(percentile(latency_ms, 0.5), 1),
+            "latency_ms_p95": round(percentile(latency_ms, 0.95), 1),
+            "latency_ms_max": round(max(latency_ms, default=0.0), 1),
+        }
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            group = isinstance(chat_id, int) and chat_id < 0
+            bucket = self._chats[chat_id] = TokenBucket(self.group_rate if group else self.chat_rate, 1, now)
+        return bucket
+
+    async def _acquire(self, chat_id, priority: int):
+        """Ждет, пока планировщик выдаст разрешение на отправку в чат"""
+        loop = asyncio.get_running_loop()
+        self._ensure_started(loop)
+        future = loop.create_future()
+        self._waiting.append((priority, next(self._seq), chat_id, future))
+        self.metrics["max_queued"] = max(self.metrics["max_queued"], len(self._waiting))
+        self._wakeup.set()
+        # Отмененное ожидание (future.cancelled()) планировщик пропускает
+        await future
+
+    def _ensure_started(self, loop: asyncio.AbstractEventLoop):
+        if self._task is None or self._task.done():
+            self._global = TokenBucket(self.global_rate, 1, loop.time())
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            delay = self._grant(loop.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _grant(self, now: float) -> Optional[float]:
+        """
+        Выдает разрешения ожидающим, чьи корзины не пусты.
+        Возвращает, через сколько секунд появится следующий токен (None - ждать новых отправок)
+        """
+        next_at = None
+        waiting = []
+        for entry in sorted(self._waiting, key=lambda entry: entry[:2]):
+            future = entry[3]
+            if future.done():
+                continue
+            bucket = self._chat_bucket(entry[2], now)
+            at = max(self._global.ready_at(now), bucket.ready_at(now))
+            if at <= now:
+                self._global.take(now)
+                bucket.take(now)
+                future.set_result(None)
+            else:
+                waiting.append(entry)
+                next_at = at if next_at is None else min(next_at, at)
+        self._waiting = waiting
+
+        if len(self._chats) > CHAT_BUCKETS_LIMIT:
+            waiting_chats = {entry[2] for entry in waiting}
+            for chat_id in [chat_id for chat_id, bucket in self._chats.items()
+                            if chat_id not in waiting_chats and bucket.idle(now)]:
+                del self._chats[chat_id]
+        return None if next_at is None else next_at - now
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """Промежуточный слой сессии бота: отправки сообщений проходят через SendScheduler"""
+
+    def __init__(self, scheduler: SendScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not isinstance(method, SCHEDULED_METHODS):
+            return await make_request(bot, method)
+        return await self.scheduler.send(make_request, bot, method, chat_id)
@@ -0,0 +1,49 @@
+"""
+Объединение одинаковых одновременных запросов (single-flight)
+Пока запрос с ключом выполняется, повторные вызовы с тем же ключом
+не запускают новый запрос, а ждут результат первого
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Группа запросов, объединяемых по ключу"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет func() или присоединяется к уже выполняющемуся вызову с тем же ключом.
+        Отмена одного из ожидающих не отменяет общий запрос для остальных.
+        """
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def running(self, key: Hashable) -> bool:
+        """Выполняется ли сейчас вызов с ключом key"""
+        return key in self._inflight
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики: всего вызовов, сэкономлено объединением, выполняется сейчас"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "inflight": len(self._inflight),
+        }
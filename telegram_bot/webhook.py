@@ -0,0 +1,190 @@
+"""
+Webhook-режим бота
+Принимает обновления от Telegram по HTTP (aiohttp), обрабатывает их
+ограниченным пулом воркеров и может работать в нескольких процессах на одном порту
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+from typing import Callable, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+import config
+from log_setup import setup_logging
+
+logger = logging.getLogger("webhook")
+
+# Сколько секунд ждать завершения дочернего процесса после SIGTERM
+STOP_TIMEOUT = 10
+
+
+class UpdateWorkerPool:
+    """
+    Очередь обновлений и фиксированное число воркеров.
+    Если очередь заполнена, прием нового обновления ждет свободного места -
+    Telegram при этом придерживает следующие обновления (обратное давление).
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, workers: int, queue_size: int):
+        self.bot = bot
+        self.dp = dp
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Дожидается обработки принятых обновлений и останавливает воркеров"""
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception:
+                self.failed += 1
+                logger.exception("Ошибка обработки обновления %s", update.update_id)
+            finally:
+                self.processed += 1
+                self.queue.task_done()
+
+
+async def handle_update(request: web.Request) -> web.Response:
+    """Принимает обновление от Telegram и ставит его в очередь"""
+    if config.WEBHOOK_SECRET:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+        if token != config.WEBHOOK_SECRET:
+            return web.Response(status=403)
+
+    pool: UpdateWorkerPool = request.app["pool"]
+    update = Update.model_validate(await request.json(), context={"bot": pool.bot})
+    await pool.queue.put(update)
+    return web.Response()
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    """Состояние процесса: размер очереди, счетчики обработанных обновлений и отправки сообщений"""
+    pool: UpdateWorkerPool = request.app["pool"]
+    health = {
+        "queue": pool.queue.qsize(),
+        "processed": pool.processed,
+        "failed": pool.failed,
+    }
+    if request.app["send_stats"] is not None:
+        health["send"] = request.app["send_stats"]()
+    return web.json_response(health)
+
+
+async def serve(create_bot: Callable[[], Bot], create_dispatcher: Callable[[], Dispatcher],
+                primary: bool, send_stats: Optional[Callable[[], dict]] = None):
+    """Запускает HTTP сервер webhook в текущем процессе"""
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    # Регистрирует webhook только один процесс, чтобы не дублировать вызовы setWebhook
+    if primary:
+        await bot.set_webhook(
+            f"{config.WEBHOOK_URL}{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+
+    pool = UpdateWorkerPool(bot, dp, config.UPDATE_CONCURRENCY, config.UPDATE_QUEUE_SIZE)
+    pool.start()
+
+    app = web.Application()
+    app["pool"] = pool
+    app["send_stats"] = send_stats
+    app.router.add_post(config.WEBHOOK_PATH, handle_update)
+    app.router.add_get("/healthz", handle_health)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(
+        runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT,
+        reuse_port=config.WEBHOOK_PROCESSES > 1
+    )
+    await site.start()
+    logger.info("Webhook слушает http://%s:%s%s", config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await pool.stop()
+        await bot.session.close()
+
+
+def _serve_process(create_bot, create_dispatcher, primary: bool, send_stats=None):
+    # В дочернем процессе поток вывода логов родителя не работает - запускаем свой
+    setup_logging(config.LOG_LEVEL, config.LOG_DEBUG_SAMPLE_RATE)
+    try:
+        asyncio.run(serve(create_bot, create_dispatcher, primary, send_stats))
+    except KeyboardInterrupt:
+        pass
+
+
+def run(create_bot: Callable[[], Bot], create_dispatcher: Callable[[], Dispatcher],
+        send_stats: Optional[Callable[[], dict]] = None):
+    """
+    Запускает webhook в WEBHOOK_PROCESSES процессах.
+    Процессы слушают один порт (SO_REUSEPORT), ядро распределяет между ними соединения.
+    send_stats - метрики отправки сообщений для GET /healthz
+    """
+    if config.WEBHOOK_PROCESSES <= 1:
+        _serve_process(create_bot, create_dispatcher, True, send_stats)
+        return
+
+    processes = [
+        multiprocessing.Process(
+            target=_serve_process,
+            args=(create_bot, create_dispatcher, index == 0, send_stats),
+            daemon=True
+        )
+        for index in range(config.WEBHOOK_PROCESSES)
+    ]
+    for process in processes:
+        process.start()
+    logger.info("Запущено процессов webhook: %s", len(processes))
+
+    # SIGTERM (остановка сервиса, terminate()) завершает и дочерние процессы: иначе
+    # они остаются без родителя и продолжают слушать порт вместе с новым запуском
+    signal.signal(signal.SIGTERM, _raise_system_exit)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _stop_processes(processes)
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+def _stop_processes(processes, timeout: float = STOP_TIMEOUT):
+    """Завершает дочерние процессы (SIGTERM) и ждет их; не успевшие за timeout убиваются"""
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            logger.warning("Процесс webhook %s не завершился за %s с", process.pid, timeout)
+            process.kill()
+            process.join()